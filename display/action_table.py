@@ -0,0 +1,139 @@
+from __future__ import annotations
+import asyncio
+import inspect
+import logging
+
+from response_actions2 import DISPLAYINPUT
+
+_LOGGER = logging.getLogger(__name__)
+
+# Page or component key matching any page or component without its own entry
+ANY = '*'
+
+# Display events that carry a user action
+ACTION_EVENTS = (DISPLAYINPUT.BUTTON, DISPLAYINPUT.TEXT)
+
+# First entry of a signature that navigates instead of calling a view, ['page', number]
+PAGE_ACTION = 'page'
+
+
+class ActionTableError(Exception):
+    pass
+
+
+class Action:
+    """View method bound to a display event, with the arguments from the table.
+
+    TEXT events pass the entered value after the table arguments.
+    """
+
+    __slots__ = ('signature', 'func', 'arguments', 'takes_value', 'motion')
+
+    def __init__(self, signature, func, arguments, takes_value):
+        self.signature = signature
+        self.func = func
+        self.arguments = tuple(arguments)
+        self.takes_value = takes_value
+        self.motion = getattr(func, 'motion', False)
+
+    def __repr__(self):
+        return f'Action({self.signature!r})'
+
+    def arguments_for(self, event) -> tuple:
+        return self.arguments + (event.value,) if self.takes_value else self.arguments
+
+
+class ActionTable:
+    """Flat lookup from (page, event type, component) to an Action.
+
+    Exact entries win over a component wildcard, which wins over a page
+    wildcard.
+    """
+
+    def __init__(self, actions):
+        self.actions = actions
+
+    def __len__(self):
+        return len(self.actions)
+
+    def lookup(self, page, event_type, component) -> Action | None:
+        actions = self.actions
+        return (actions.get((page, event_type, component))
+                or actions.get((page, event_type, ANY))
+                or actions.get((ANY, event_type, component)))
+
+
+def compile_actions(table, views, navigation) -> ActionTable:
+    """Check every entry of `table` against `views` and bind it.
+
+    Raises ActionTableError listing every bad entry, so a broken table stops
+    the service at startup instead of failing on a touch.
+    """
+    actions = {}
+    errors = []
+
+    for page, events in table.items():
+        if not _valid_key(page):
+            errors.append(f'page {page!r}: not a page number')
+            continue
+
+        for event_type, components in events.items():
+            if event_type not in ACTION_EVENTS:
+                errors.append(f'page {page}: {event_type!r} is not an action event type')
+                continue
+
+            for component, signature in components.items():
+                where = f'page {page} {event_type.name} {component}'
+                if not _valid_key(component):
+                    errors.append(f'{where}: not a component id')
+                    continue
+
+                try:
+                    actions[(page, event_type, component)] = _bind(signature, event_type, views, navigation)
+                except ActionTableError as e:
+                    errors.append(f'{where}: {e}')
+
+    if errors:
+        raise ActionTableError('Invalid response actions:\n  ' + '\n  '.join(errors))
+
+    _LOGGER.debug("Compiled %d display actions", len(actions))
+    return ActionTable(actions)
+
+
+def _valid_key(key) -> bool:
+    return key == ANY or (type(key) is int and 0 <= key <= 0xFF)
+
+
+def _bind(signature, event_type, views, navigation) -> Action:
+    if not isinstance(signature, (list, tuple)) or not signature:
+        raise ActionTableError(f'{signature!r} is not a [view, method, arguments...] list')
+
+    takes_value = event_type == DISPLAYINPUT.TEXT
+
+    if signature[0] == PAGE_ACTION:
+        func, arguments = navigation.page, signature[1:]
+        if len(arguments) != 1 or type(arguments[0]) is not int:
+            raise ActionTableError(f'{signature!r} needs a single page number')
+        takes_value = False
+    else:
+        if len(signature) < 2:
+            raise ActionTableError(f'{signature!r} has no method')
+
+        view_name, method, arguments = signature[0], signature[1], signature[2:]
+        view = views.get(view_name)
+        if view is None:
+            raise ActionTableError(f'unknown view {view_name!r}')
+
+        func = getattr(view, method, None)
+        if func is None or method.startswith('_'):
+            raise ActionTableError(f'{view_name} has no action {method!r}')
+
+    if not asyncio.iscoroutinefunction(func):
+        raise ActionTableError(f'{signature!r} is not a coroutine')
+
+    try:
+        inspect.signature(func).bind(*arguments, *((None,) if takes_value else ()))
+    except TypeError as e:
+        raise ActionTableError(f'{signature!r} does not match the method: {e}') from None
+
+    return Action(signature, func, arguments, takes_value)
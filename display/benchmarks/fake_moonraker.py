@@ -0,0 +1,143 @@
+import asyncio
+import json
+import time
+
+from aiohttp import web, WSMsgType
+
+
+def default_status():
+    return {
+        'toolhead': {'position': [0.0, 0.0, 0.0, 0.0]},
+        'print_stats': {'state': 'standby', 'filename': '', 'print_duration': 0.0, 'total_duration': 0.0},
+        'fan': {'speed': 0.0},
+        'gcode_move': {'position': [0.0, 0.0, 0.0, 0.0], 'speed': 0.0},
+        'extruder': {'temperature': 25.0, 'target': 0.0},
+        'heater_bed': {'temperature': 25.0, 'target': 0.0},
+        'heater_bed_outer': {},
+    }
+
+
+class FakeMoonraker:
+    """Local JSON-RPC websocket server answering the calls the display makes.
+
+    `rpc_delay` is added to every answer and `gcode_delay` to every
+    printer.gcode.script call to stand in for Klipper executing it. Klippy
+    reports ready `klippy_delay` seconds after start.
+    """
+
+    def __init__(self, files=0, rpc_delay=0.0, gcode_delay=0.0, klippy_delay=0.0):
+        self.status = default_status()
+        self.files = [{'path': f'benchmark_{index:04d}.gcode', 'modified': 1700000000.0 + index,
+                       'size': 100000 + index, 'permissions': 'rw'} for index in range(files)]
+        self.rpc_delay = rpc_delay
+        self.gcode_delay = gcode_delay
+        self.klippy_delay = klippy_delay
+        self.klippy_state = 'startup'
+        self.websockets = set()
+        self.gcode_log = []
+        self.watchers = []
+        self.runner = None
+        self.port = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_get('/websocket', self._handle_websocket)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+        if self.klippy_delay:
+            asyncio.get_running_loop().call_later(self.klippy_delay,
+                                                  lambda: asyncio.ensure_future(self.set_klippy_ready()))
+        else:
+            self.klippy_state = 'ready'
+
+    async def set_klippy_ready(self):
+        self.klippy_state = 'ready'
+        await self.notify('notify_klippy_ready', [])
+
+    async def close(self):
+        for websocket in list(self.websockets):
+            await websocket.close()
+        await self.runner.cleanup()
+
+    async def push_status(self, update):
+        for name, fields in update.items():
+            self.status.setdefault(name, {}).update(fields)
+
+        await self.notify('notify_status_update', [update, time.monotonic()])
+
+    async def notify(self, method, params):
+        message = json.dumps({'jsonrpc': '2.0', 'method': method, 'params': params})
+        for websocket in list(self.websockets):
+            await websocket.send_str(message)
+
+    async def wait_for_gcode(self, predicate, timeout=5.0) -> float:
+        waiter = asyncio.get_running_loop().create_future()
+        self.watchers.append((predicate, waiter))
+
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            self.watchers = [(p, w) for p, w in self.watchers if w is not waiter]
+
+    async def _handle_websocket(self, request):
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.websockets.add(websocket)
+
+        try:
+            async for message in websocket:
+                if message.type == WSMsgType.TEXT:
+                    asyncio.ensure_future(self._respond(websocket, json.loads(message.data)))
+        finally:
+            self.websockets.discard(websocket)
+
+        return websocket
+
+    async def _respond(self, websocket, request):
+        if self.rpc_delay:
+            await asyncio.sleep(self.rpc_delay)
+
+        result = await self._call(request['method'], request.get('params', {}))
+
+        if not websocket.closed:
+            await websocket.send_str(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': result}))
+
+    async def _call(self, method, params):
+        if method == 'server.info':
+            return {'klippy_state': self.klippy_state, 'klippy_connected': True}
+
+        if method in ('printer.objects.subscribe', 'printer.objects.query'):
+            objects = params.get('objects', {})
+            return {'eventtime': time.monotonic(),
+                    'status': {name: dict(self.status.get(name, {})) for name in objects}}
+
+        if method == 'printer.gcode.script':
+            timestamp = time.perf_counter()
+            script = params['script']
+            self.gcode_log.append((timestamp, script))
+
+            for predicate, waiter in self.watchers:
+                if not waiter.done() and predicate(script):
+                    waiter.set_result(timestamp)
+
+            if self.gcode_delay:
+                await asyncio.sleep(self.gcode_delay * len(script.splitlines()))
+            return 'ok'
+
+        if method == 'server.files.roots':
+            return [{'name': 'gcodes', 'path': '/tmp/benchmark/gcodes', 'permissions': 'rw'}]
+
+        if method == 'server.files.list':
+            return self.files
+
+        if method == 'server.files.get_directory':
+            return {'dirs': [], 'files': [dict(file_data, filename=file_data['path']) for file_data in self.files]}
+
+        if method == 'server.files.metadata':
+            return {'filename': params['filename'], 'modified': 1700000000.0, 'size': 100000, 'thumbnails': []}
+
+        return {}
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import tty
+
+TERMINATOR = b'\xff\xff\xff'
+
+
+class FakeNextion:
+    """Pseudo terminal standing in for the Nextion display.
+
+    Records every command written to it, answers `sendme` and bkcmd return
+    codes like the real display and injects touch and numeric frames. `device` is a symlink to
+    the pseudo terminal so the link can be dropped and replaced.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.directory = tempfile.mkdtemp()
+        self.device = os.path.join(self.directory, 'ttyNextion')
+        self._open_pty()
+        self.buffer = bytearray()
+        self.commands = []
+        self.bytes_received = 0
+        self.page = 0
+        self.bkcmd = 0
+        self.watchers = []
+
+    def start(self):
+        self.loop.add_reader(self.master, self._read)
+
+    def stop(self):
+        self.loop.remove_reader(self.master)
+
+    def close(self):
+        # Only close once the display side is gone, it sees a hangup otherwise
+        os.close(self.master)
+        os.close(self.slave)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def drop_link(self):
+        """Hang up and put a new pseudo terminal behind `device`, like a USB adapter re-enumerating."""
+        old = (self.master, self.slave)
+        self.stop()
+        self._open_pty()
+        self.start()
+        self.buffer.clear()
+        self.page = 0
+
+        for fd in old:
+            os.close(fd)
+
+    def reset_counters(self):
+        self.commands.clear()
+        self.bytes_received = 0
+
+    def touch(self, page, component, event=0x01) -> float:
+        return self._write(bytes([0x65, page, component, event]) + TERMINATOR)
+
+    def numeric(self, page, component, value) -> float:
+        return self._write(bytes([0x71, page, component]) + value.to_bytes(4, 'little', signed=True) + TERMINATOR)
+
+    async def wait_for(self, predicate, timeout=5.0) -> float:
+        """Wait for a command matching `predicate` and return when it arrived."""
+        waiter = self.loop.create_future()
+        self.watchers.append((predicate, waiter))
+
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            self.watchers = [(p, w) for p, w in self.watchers if w is not waiter]
+
+    def _open_pty(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+
+        if os.path.lexists(self.device):
+            os.remove(self.device)
+        os.symlink(os.ttyname(self.slave), self.device)
+
+    def _write(self, frame) -> float:
+        timestamp = time.perf_counter()
+        os.write(self.master, frame)
+        return timestamp
+
+    def _read(self):
+        data = os.read(self.master, 4096)
+        timestamp = time.perf_counter()
+        self.bytes_received += len(data)
+        self.buffer += data
+
+        while (end := self.buffer.find(TERMINATOR)) != -1:
+            command = self.buffer[:end].decode('utf-8', errors='replace')
+            del self.buffer[:end + len(TERMINATOR)]
+            self._handle(command, timestamp)
+
+    def _handle(self, command, timestamp):
+        self.commands.append((timestamp, command))
+
+        if command == 'sendme':
+            self._write(bytes([0x66, self.page]) + TERMINATOR)
+        elif command.startswith('page '):
+            self.page = int(command[5:])
+        elif command.startswith('bkcmd='):
+            self.bkcmd = int(command[6:])
+
+        if self.bkcmd == 3 and command != 'sendme' and not command.startswith('get '):
+            self._write(bytes([0x01]) + TERMINATOR)
+
+        for predicate, waiter in self.watchers:
+            if not waiter.done() and predicate(command):
+                waiter.set_result(timestamp)
@@ -0,0 +1,192 @@
+"""Memory and event loop lag of printer_host.py per driven printer.
+
+Starts printer_host.py as its own process for 1 and for N printers, each a
+fake display (pty) and a fake Moonraker server in this process, pushes a
+printing-like status stream to every printer and touches every display
+while it runs. Then reports the host's resident memory, the memory added
+by every printer past the first, and the event loop lag and touch to
+handler latency from its metrics endpoint.
+
+    python benchmarks/multi_printer.py [--printers 1 --printers 8] [--duration 10] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_moonraker import FakeMoonraker  # noqa: E402
+from fake_nextion import FakeNextion  # noqa: E402
+from metrics import LATENCY_BUCKETS  # noqa: E402
+
+HOST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'printer_host.py')
+
+STARTUP_TIMEOUT = 30
+SETTLE_TIME = 1.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def write_config(path, printers, state_dir, metrics_port):
+    lines = ['[host]', 'metrics_host = 127.0.0.1', f'metrics_port = {metrics_port}', '']
+    for index, (nextion, moonraker) in enumerate(printers):
+        lines += [f'[printer n4-{index:02d}]',
+                  f'device = {nextion.device}',
+                  'host = 127.0.0.1',
+                  f'port = {moonraker.port}',
+                  f'state_dir = {os.path.join(state_dir, str(index))}',
+                  '']
+
+    with open(path, 'w') as config_file:
+        config_file.write('\n'.join(lines))
+
+
+def resident_memory(pid) -> int:
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def scrape(metrics_port) -> dict:
+    """Histogram buckets by metric name summed over all printers."""
+    with urllib.request.urlopen(f'http://127.0.0.1:{metrics_port}/metrics', timeout=5) as response:
+        text = response.read().decode('utf-8')
+
+    histograms = {}
+    for line in text.splitlines():
+        if '_bucket{' not in line:
+            continue
+
+        series, value = line.rsplit(' ', 1)
+        name = series.split('_bucket{', 1)[0]
+        bound = series.split('le="', 1)[1].split('"', 1)[0]
+        buckets = histograms.setdefault(name, {})
+        buckets[bound] = buckets.get(bound, 0) + int(value)
+
+    return histograms
+
+
+def quantile_ms(buckets, q):
+    total = buckets.get('+Inf', 0)
+    if not total:
+        return None
+
+    for bound in LATENCY_BUCKETS:
+        if buckets.get(str(bound), 0) >= q * total:
+            return bound * 1000
+    return float('inf')
+
+
+async def drive(nextion, moonraker, duration):
+    await moonraker.push_status({'print_stats': {'state': 'printing', 'filename': 'benchmark_0000.gcode'}})
+
+    started = time.perf_counter()
+    tick = 0
+    while time.perf_counter() - started < duration:
+        tick += 1
+        await moonraker.push_status({
+            'print_stats': {'print_duration': tick * 0.25, 'total_duration': tick * 0.25 + 5},
+            'gcode_move': {'position': [tick % 200, (tick * 3) % 200, tick * 0.01, 0.0], 'speed': 100 + tick % 50},
+            'toolhead': {'position': [tick % 200, (tick * 3) % 200, tick * 0.01, 0.0]},
+            'extruder': {'temperature': float(180 + tick % 30)},
+        })
+
+        # Print page > LED
+        nextion.touch(19, 3)
+        await asyncio.sleep(0.25)
+
+
+async def run_host(loop, count, duration):
+    printers = []
+    for _ in range(count):
+        nextion = FakeNextion(loop)
+        nextion.start()
+        moonraker = FakeMoonraker()
+        await moonraker.start()
+        printers.append((nextion, moonraker))
+
+    metrics_port = free_port()
+    with tempfile.TemporaryDirectory() as state_dir:
+        config = os.path.join(state_dir, 'printers.cfg')
+        write_config(config, printers, state_dir, metrics_port)
+
+        host = subprocess.Popen([sys.executable, HOST, config], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            await asyncio.gather(*[nextion.wait_for(lambda command: command == 'page 1', timeout=STARTUP_TIMEOUT)
+                                   for nextion, _ in printers])
+            await asyncio.sleep(SETTLE_TIME)
+            idle_memory = resident_memory(host.pid)
+
+            await asyncio.gather(*[drive(nextion, moonraker, duration) for nextion, moonraker in printers])
+            memory = resident_memory(host.pid)
+            histograms = await loop.run_in_executor(None, scrape, metrics_port)
+        finally:
+            host.terminate()
+            await loop.run_in_executor(None, host.wait)
+            for nextion, moonraker in printers:
+                await moonraker.close()
+                nextion.stop()
+                nextion.close()
+
+    lag = histograms.get('display_loop_lag_seconds', {})
+    touch = histograms.get('display_touch_to_handler_seconds', {})
+    return {
+        'printers': count,
+        'idle_rss_mb': round(idle_memory / 2 ** 20, 1),
+        'printing_rss_mb': round(memory / 2 ** 20, 1),
+        'loop_lag_p99_ms': quantile_ms(lag, 0.99),
+        'touch_to_handler_p95_ms': quantile_ms(touch, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--printers', type=int, action='append',
+                        help='printers per host run, may be repeated (default: 1 and 8)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of printing per run')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    runs = []
+    for count in sorted(set(args.printers or [1, 8])):
+        loop = asyncio.new_event_loop()
+        try:
+            runs.append(loop.run_until_complete(run_host(loop, count, args.duration)))
+        finally:
+            loop.close()
+
+    # Memory every printer past the first adds, between the smallest and largest run
+    first, last = runs[0], runs[-1]
+    per_printer = None
+    if last['printers'] > first['printers']:
+        per_printer = round((last['printing_rss_mb'] - first['printing_rss_mb'])
+                            / (last['printers'] - first['printers']), 2)
+    report = {'runs': runs, 'rss_mb_per_extra_printer': per_printer}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for run in runs:
+        print(f'{run["printers"]} printers:')
+        for metric, value in run.items():
+            if metric != 'printers':
+                print(f'  {metric}: {value}')
+    print(f'rss_mb_per_extra_printer: {per_printer}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Replays a traffic capture through displayasync without hardware.
+
+A capture is recorded by the running service with CAPTURE_FILE set in
+displayasync, or by run_benchmarks.py --capture. Display input, Moonraker
+notifications and websocket state changes are fed into a fresh
+NavigationController at their recorded times, or as fast as possible with
+--speed 0, and every RPC is answered with the result recorded for it. The
+report compares serial bytes written and RPCs made with the capture and
+gives the CPU time and the display latencies, so runs of the same capture
+on two code versions can be compared.
+
+Timers in the service run on the wall clock, so only replays at the same
+speed are comparable.
+
+    python benchmarks/replay.py capture.n4tl [--speed 1] [--json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import Counter, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import displayasync  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from traffic_log import TRAFFIC, read_traffic  # noqa: E402
+
+# Seconds given to the last redraws once all records are fed
+SETTLE_TIME = 0.5
+
+
+class ReplayTransport(asyncio.Transport):
+    """Serial transport stand-in counting what the display would receive."""
+
+    def __init__(self):
+        super().__init__()
+        self.serial = types.SimpleNamespace(rts=False)
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class ReplayMoonraker(displayasync.MoonrakerController):
+    """MoonrakerController answering every RPC from the capture.
+
+    Results are handed out in recorded order per method, the last one is
+    repeated once a method has been called more often than in the capture.
+    """
+
+    def __init__(self, loop, records, metrics):
+        super().__init__(loop, metrics=metrics)
+        self.answers = {}
+        self.calls = Counter()
+
+        for _, kind, payload in records:
+            if kind == TRAFFIC.RPC_RESULT:
+                method, result = json.loads(payload)
+                self.answers.setdefault(method, deque()).append(result)
+
+    async def call_method(self, method, **kwargs):
+        self.calls[method] += 1
+
+        answers = self.answers.get(method)
+        if not answers:
+            return 'ok' if method == 'printer.gcode.script' else {}
+
+        return answers.popleft() if len(answers) > 1 else answers[0]
+
+
+def latency(histogram):
+    if not histogram.count:
+        return None
+
+    return {
+        'count': histogram.count,
+        'mean_ms': round(histogram.sum / histogram.count * 1000, 2),
+        'p95_bucket_ms': histogram.quantile(0.95) * 1000,
+    }
+
+
+async def feed(display, moonraker, kind, payload):
+    if kind == TRAFFIC.SERIAL_IN:
+        display.data_received(payload)
+    elif kind == TRAFFIC.NOTIFICATION:
+        await moonraker.on_notification(*json.loads(payload))
+    elif kind == TRAFFIC.STATE:
+        await moonraker.state_changed(payload.decode('utf-8'))
+
+
+async def replay(loop, path, speed=1.0):
+    records = read_traffic(path)
+    metrics = Metrics()
+
+    display = displayasync.DisplayController()
+    transport = ReplayTransport()
+    display.connection_made(transport)
+    moonraker = ReplayMoonraker(loop, records, metrics)
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        navigation = displayasync.NavigationController(loop, display, moonraker,
+                                                       snapshot_file=os.path.join(state_dir, 'snapshot.json'),
+                                                       metrics=metrics)
+        await navigation.show_splash()
+        running = loop.create_task(navigation.startup())
+
+        started = loop.time()
+        cpu_started = time.process_time()
+        try:
+            for timestamp, kind, payload in records:
+                if speed:
+                    delay = started + timestamp / speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                try:
+                    await feed(display, moonraker, kind, payload)
+                except Exception as e:
+                    logging.error("Replaying %s failed: %s", kind.name, repr(e))
+
+                # Let the handlers started by this record run before the next one
+                await asyncio.sleep(0)
+
+            await display.drain()
+            await asyncio.sleep(SETTLE_TIME)
+        finally:
+            running.cancel()
+            await asyncio.gather(running, *navigation.tasks, return_exceptions=True)
+
+        cpu_time = time.process_time() - cpu_started
+        elapsed = loop.time() - started
+
+    captured = Counter()
+    captured_bytes = 0
+    for _, kind, payload in records:
+        if kind == TRAFFIC.SERIAL_OUT:
+            captured_bytes += len(payload)
+        elif kind == TRAFFIC.RPC_REQUEST:
+            captured[json.loads(payload)[0]] += 1
+
+    return {
+        'records': len(records),
+        'captured_seconds': round(records[-1][0], 2) if records else 0.0,
+        'replay_seconds': round(elapsed, 2),
+        'cpu_seconds': round(cpu_time, 3),
+        'serial_bytes_written': transport.bytes_written,
+        'serial_bytes_captured': captured_bytes,
+        'rpc_calls': dict(moonraker.calls),
+        'rpc_calls_captured': dict(captured),
+        'touch_to_handler': latency(navigation.touch_latency),
+        'handler_to_gcode': latency(navigation.gcode_latency),
+        'status_to_serial': latency(navigation.status_latency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('capture', help='traffic capture to replay')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed, 0 replays as fast as possible (default: 1)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    logging.getLogger('displayasync').setLevel(logging.WARNING)
+
+    loop = asyncio.new_event_loop()
+    try:
+        report = loop.run_until_complete(replay(loop, args.capture, args.speed))
+    finally:
+        loop.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for metric, value in report.items():
+        print(f'{metric}: {value}')
+
+
+if __name__ == '__main__':
+    main()
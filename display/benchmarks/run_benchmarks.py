@@ -0,0 +1,313 @@
+"""End-to-end latency benchmarks for displayasync.
+
+Runs the displayasync main() wiring against a pseudo terminal standing in for
+the Nextion display and a local fake Moonraker websocket server, then reports
+touch-to-gcode latency, status-change-to-pixel latency, serial bytes per
+second, the time from start to the first usable screen and the time to
+recover from a Klipper, Moonraker or serial link restart for each scenario.
+
+    python benchmarks/run_benchmarks.py [--scenario jogging] [--duration 10] [--capture DIR] [--json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import displayasync  # noqa: E402
+from fake_moonraker import FakeMoonraker, default_status  # noqa: E402
+from fake_nextion import FakeNextion  # noqa: E402
+
+STARTUP_TIMEOUT = 15
+SETTLE_TIME = 0.5
+
+# Seconds Klippy takes to report ready in the start up scenarios
+KLIPPY_START_DELAY = 3.0
+
+# Seconds Klippy or Moonraker are gone in the restart scenarios
+RESTART_DELAY = 0.5
+
+
+class Results:
+    def __init__(self):
+        self.touch_to_gcode = []
+        self.touch_to_pixel = []
+        self.status_to_pixel = []
+        self.bytes_per_second = 0.0
+        self.startup_to_screen = 0.0
+        self.recovery = []
+
+    @staticmethod
+    def summarize(samples):
+        if not samples:
+            return None
+
+        samples = sorted(sample * 1000 for sample in samples)
+        return {
+            'count': len(samples),
+            'p50_ms': round(statistics.median(samples), 2),
+            'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 2),
+            'max_ms': round(samples[-1], 2),
+        }
+
+    def as_dict(self):
+        return {
+            'touch_to_gcode': self.summarize(self.touch_to_gcode),
+            'touch_to_pixel': self.summarize(self.touch_to_pixel),
+            'status_to_pixel': self.summarize(self.status_to_pixel),
+            'recovery': self.summarize(self.recovery),
+            'serial_bytes_per_second': round(self.bytes_per_second, 1),
+            'startup_to_screen_ms': round(self.startup_to_screen * 1000, 1),
+        }
+
+
+async def measure_status(nextion, moonraker, results, update, value):
+    pushed = time.perf_counter()
+    drawn = nextion.wait_for(lambda command: command.startswith(f'nozzletemp.txt="{value}'))
+    await moonraker.push_status(update)
+    try:
+        results.status_to_pixel.append(await drawn - pushed)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def scenario_idle(nextion, moonraker, results, duration):
+    await asyncio.sleep(duration)
+
+
+async def scenario_printing(nextion, moonraker, results, duration):
+    await moonraker.push_status({
+        'print_stats': {'state': 'printing', 'filename': 'benchmark_0000.gcode'},
+        'extruder': {'target': 210.0},
+        'heater_bed': {'target': 60.0},
+        'fan': {'speed': 1.0},
+    })
+
+    started = time.perf_counter()
+    tick = 0
+    while time.perf_counter() - started < duration:
+        tick += 1
+        update = {
+            'print_stats': {'print_duration': tick * 0.25, 'total_duration': tick * 0.25 + 5},
+            'gcode_move': {'position': [tick % 200, (tick * 3) % 200, tick * 0.01, 0.0], 'speed': 100 + tick % 50},
+            'toolhead': {'position': [tick % 200, (tick * 3) % 200, tick * 0.01, 0.0]},
+        }
+
+        # Klipper reports temperatures about once a second
+        if tick % 4 == 0:
+            value = 180 + tick % 30
+            update['extruder'] = {'temperature': float(value)}
+            await measure_status(nextion, moonraker, results, update, value)
+        else:
+            await moonraker.push_status(update)
+
+        await asyncio.sleep(0.25)
+
+
+async def scenario_jogging(nextion, moonraker, results, duration):
+    # Main page > Prepare ( Move )
+    nextion.touch(1, 2)
+    await nextion.wait_for(lambda command: command == 'page 8')
+
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        moved = moonraker.wait_for_gcode(lambda script: 'G1' in script)
+        touched = nextion.touch(8, 8)  # X+
+        try:
+            results.touch_to_gcode.append(await moved - touched)
+        except asyncio.TimeoutError:
+            pass
+
+        await asyncio.sleep(0.1)
+
+
+async def scenario_browsing(nextion, moonraker, results, duration):
+    # Main page > Print
+    listed = nextion.wait_for(lambda command: command.startswith('t10.txt='))
+    touched = nextion.touch(1, 1)
+    results.touch_to_pixel.append(await listed - touched)
+
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        listed = nextion.wait_for(lambda command: command.startswith('t10.txt='))
+        touched = nextion.touch(2, 2)  # Next page
+        try:
+            results.touch_to_pixel.append(await listed - touched)
+        except asyncio.TimeoutError:
+            pass
+
+        await asyncio.sleep(0.1)
+
+
+async def scenario_startup(nextion, moonraker, results, duration):
+    # Only the time to the first screen is of interest
+    pass
+
+
+async def scenario_klippy_restart(nextion, moonraker, results, duration):
+    started = time.perf_counter()
+    value = 100
+    while time.perf_counter() - started < duration:
+        # Klippy comes back with a new temperature, recovered once it is drawn
+        value += 1
+        moonraker.status['extruder']['temperature'] = float(value)
+        drawn = nextion.wait_for(lambda command: command.startswith(f'nozzletemp.txt="{value}'))
+        await moonraker.notify('notify_klippy_disconnected', [])
+        await asyncio.sleep(RESTART_DELAY)
+        ready = time.perf_counter()
+        await moonraker.set_klippy_ready()
+        try:
+            results.recovery.append(await drawn - ready)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def scenario_moonraker_restart(nextion, moonraker, results, duration):
+    started = time.perf_counter()
+    value = 100
+    while time.perf_counter() - started < duration:
+        value += 1
+        moonraker.status['extruder']['temperature'] = float(value)
+        drawn = nextion.wait_for(lambda command: command.startswith(f'nozzletemp.txt="{value}'))
+        await moonraker.close()
+        await asyncio.sleep(RESTART_DELAY)
+        restarted = time.perf_counter()
+        await moonraker.start(port=moonraker.port)
+        try:
+            results.recovery.append(await drawn - restarted)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def scenario_serial_reopen(nextion, moonraker, results, duration):
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        drawn = nextion.wait_for(lambda command: command == 'page 1')
+        lost = time.perf_counter()
+        nextion.drop_link()
+        try:
+            results.recovery.append(await drawn - lost)
+        except asyncio.TimeoutError:
+            pass
+
+        await asyncio.sleep(0.2)
+
+
+def write_snapshot(path):
+    displayasync.JsonStore(path).save({'printer_status': default_status(), 'print': {}})
+
+
+SCENARIOS = {
+    'idle': (scenario_idle, {}),
+    'printing': (scenario_printing, {}),
+    'jogging': (scenario_jogging, {}),
+    'browsing': (scenario_browsing, {'files': 1000}),
+    'cold_start': (scenario_startup, {'klippy_delay': KLIPPY_START_DELAY}),
+    'warm_start': (scenario_startup, {'klippy_delay': KLIPPY_START_DELAY, 'snapshot': True}),
+    'klippy_restart': (scenario_klippy_restart, {}),
+    'moonraker_restart': (scenario_moonraker_restart, {}),
+    'serial_reopen': (scenario_serial_reopen, {}),
+}
+
+
+async def startup(display, nextion) -> float:
+    """Wait for the home page, a service that fails before raises its own error."""
+    shown = asyncio.ensure_future(nextion.wait_for(lambda command: command == 'page 1', timeout=STARTUP_TIMEOUT))
+    try:
+        await asyncio.wait([shown, display], return_when=asyncio.FIRST_COMPLETED)
+        if display.done() and not shown.done():
+            display.result()
+            raise RuntimeError('displayasync stopped before showing the home page')
+        return await shown
+    finally:
+        shown.cancel()
+
+
+async def run_scenario(name, nextion, duration, rpc_delay, gcode_delay, capture_file=None):
+    scenario, options = SCENARIOS[name]
+    options = dict(options)
+    snapshot = options.pop('snapshot', False)
+    loop = asyncio.get_running_loop()
+
+    nextion.start()
+    moonraker = FakeMoonraker(rpc_delay=rpc_delay, gcode_delay=gcode_delay, **options)
+    await moonraker.start()
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        snapshot_file = os.path.join(state_dir, 'snapshot.json')
+        if snapshot:
+            write_snapshot(snapshot_file)
+
+        results = Results()
+        started = time.perf_counter()
+        display = loop.create_task(displayasync.main(loop, device=nextion.device, host='127.0.0.1',
+                                                     port=moonraker.port,
+                                                     state_file=os.path.join(state_dir, 'display.json'),
+                                                     snapshot_file=snapshot_file,
+                                                     capture_file=capture_file))
+        try:
+            results.startup_to_screen = await startup(display, nextion) - started
+            await asyncio.sleep(SETTLE_TIME)
+
+            nextion.reset_counters()
+            started = time.perf_counter()
+            await scenario(nextion, moonraker, results, duration)
+            results.bytes_per_second = nextion.bytes_received / (time.perf_counter() - started)
+        finally:
+            display.cancel()
+            await asyncio.gather(display, return_exceptions=True)
+            await moonraker.close()
+            nextion.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS.keys(),
+                        help='scenario to run, may be repeated (default: all)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per scenario')
+    parser.add_argument('--rpc-delay', type=float, default=0.002, help='seconds added to every RPC answer')
+    parser.add_argument('--gcode-delay', type=float, default=0.02, help='seconds per executed gcode line')
+    parser.add_argument('--capture', metavar='DIR', help='record every scenario to DIR/<scenario>.n4tl for replay.py')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    logging.getLogger('displayasync').setLevel(logging.WARNING)
+    # Tearing the service down between scenarios leaves its client tasks behind
+    logging.getLogger('asyncio').setLevel(logging.CRITICAL)
+
+    if args.capture:
+        os.makedirs(args.capture, exist_ok=True)
+
+    report = {}
+    for name in args.scenario or SCENARIOS:
+        loop = asyncio.new_event_loop()
+        nextion = FakeNextion(loop)
+        try:
+            results = loop.run_until_complete(
+                run_scenario(name, nextion, args.duration, args.rpc_delay, args.gcode_delay,
+                             os.path.join(args.capture, f'{name}.n4tl') if args.capture else None))
+        finally:
+            loop.close()
+            nextion.close()
+        report[name] = results.as_dict()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, result in report.items():
+        print(f'{name}:')
+        for metric, value in result.items():
+            print(f'  {metric}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Per-notification cost of applying notify_status_update messages.
+
+Replays a printing-like stream of status updates into StatusStore and
+reports the time and the memory allocated per update, measured with
+tracemalloc. deepmerge is measured as well when it is installed. The
+print page is redrawn for the status after every update, once through
+NavigationController.render_status from command templates and once by
+formatting and encoding every changed command.
+
+    python benchmarks/status_updates.py [--updates 10000] [--json]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import displayasync  # noqa: E402
+from fake_moonraker import default_status  # noqa: E402
+from nextion import encode_command  # noqa: E402
+from status_store import StatusStore  # noqa: E402
+import views  # noqa: E402
+
+PRINT_PAGE = 19
+
+
+def status_updates(count):
+    """Updates shaped like what Moonraker sends about 4 times a second while printing."""
+    updates = []
+    for tick in range(count):
+        update = {
+            'print_stats': {'print_duration': tick * 0.25, 'total_duration': tick * 0.25 + 5},
+            'gcode_move': {'position': [tick % 200, (tick * 3) % 200, tick * 0.01, 0.0], 'speed': 100 + tick % 50},
+            'toolhead': {'position': [tick % 200, (tick * 3) % 200, tick * 0.01, 0.0]},
+        }
+        if tick % 4 == 0:
+            update['extruder'] = {'temperature': 200 + tick % 5}
+        updates.append(update)
+
+    return updates
+
+
+def measure(apply, updates):
+    # One pass without tracing for the time, one traced pass for the allocations
+    started = time.perf_counter()
+    for update in updates:
+        apply(update)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    allocated = 0
+    for update in updates:
+        apply(update)
+        current, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+        tracemalloc.reset_peak()
+        before = current
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        'us_per_update': round(elapsed / len(updates) * 1e6, 2),
+        'bytes_allocated_per_update': round(allocated / len(updates), 1),
+        'bytes_retained': retained,
+    }
+
+
+def store_apply():
+    store = StatusStore(default_status())
+
+    def apply(update):
+        store.update(update)
+        store.take_changed()
+
+    return apply
+
+
+def deepmerge_apply():
+    from deepmerge import always_merger
+
+    state = {'status': copy.deepcopy(default_status())}
+
+    def apply(update):
+        state['status'] = always_merger.merge(state['status'], update)
+
+    return apply
+
+
+def printer_statuses(updates):
+    store = StatusStore(default_status())
+    statuses = []
+    for update in updates:
+        store.update(update)
+        statuses.append(copy.deepcopy(store.status))
+
+    return statuses
+
+
+def render_apply(loop, templated):
+    """Redraws the print page for a full printer status through NavigationController."""
+    bindings = views.Print.bindings[PRINT_PAGE]
+    display = displayasync.DisplayController()
+    moonraker = displayasync.MoonrakerController(loop)
+    navigation = displayasync.NavigationController(loop, display, moonraker, snapshot_file=os.devnull)
+    navigation.component_cache.set_page(PRINT_PAGE)
+    output = display.output
+
+    def apply(printer_status):
+        moonraker.printer_status = printer_status
+
+        if templated:
+            navigation.render_status(bindings)
+            output.take()
+            return
+
+        # Formatting and encoding every changed command, as before command templates
+        cache = navigation.component_cache
+        commands = []
+        for binding in bindings:
+            value = binding.value(navigation._status_value)
+            if value is not None and not cache.showing(binding.key, value):
+                command = binding.command.format(value)
+                cache.shown(binding.key, value, displayasync.command_size(command))
+                commands.append(command)
+        b''.join(encode_command(command) for command in commands)
+
+    return apply
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=10000, help='number of status updates to apply')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    updates = status_updates(args.updates)
+    statuses = printer_statuses(updates)
+    loop = asyncio.new_event_loop()
+    try:
+        report = {
+            'status_store': measure(store_apply(), updates),
+            'render_templates': measure(render_apply(loop, True), statuses),
+            'render_format_encode': measure(render_apply(loop, False), statuses),
+        }
+    finally:
+        loop.close()
+
+    try:
+        report['deepmerge'] = measure(deepmerge_apply(), updates)
+    except ImportError:
+        pass
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for name, result in report.items():
+        print(f'{name}:')
+        for metric, value in result.items():
+            print(f'  {metric}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import datetime
+
+from component_cache import ComponentCache
+from nextion import CommandTemplate
+
+# Printer model picture on the main page
+MODEL_PICTURES = {
+    'n4': 213,
+    'n4pro': 214,
+}
+
+
+class Binding:
+    """Display command rendered from printer status fields.
+
+    `inputs` are `(object, field)` pairs whose values are passed to
+    `formatter`, the result is filled into `template`, which is compiled to
+    a CommandTemplate so only the value is encoded. The command is skipped
+    while an input is missing unless `optional` is set, then the formatter
+    receives None for it. `kind` is the field class that sets how often it
+    is redrawn.
+    """
+
+    __slots__ = ('template', 'command', 'key', 'inputs', 'formatter', 'kind', 'optional')
+
+    def __init__(self, template, inputs, formatter=str, kind='status', optional=False):
+        self.template = template
+        self.command = CommandTemplate(template)
+        # Component the command assigns, e.g. `nozzletemp.txt` or `vis q5`
+        self.key = ComponentCache.key(template)
+        self.inputs = tuple(inputs)
+        self.formatter = formatter
+        self.kind = kind
+        self.optional = optional
+
+    def __repr__(self):
+        return f'Binding({self.template!r})'
+
+    def value(self, lookup):
+        values = [lookup(name, field) for name, field in self.inputs]
+        if not self.optional and None in values:
+            return None
+
+        return self.formatter(*values)
+
+
+def printer_model(status) -> str:
+    # Only the Pro has the outer bed heater
+    return 'n4pro' if 'temperature' in status.get('heater_bed_outer', {}) else 'n4'
+
+
+def integer(value):
+    return int(value)
+
+
+def axis(index):
+    return lambda position: int(position[index])
+
+
+def percent(value):
+    return int(value * 100)
+
+
+def duration(seconds):
+    return datetime.timedelta(seconds=int(seconds))
+
+
+def visible(value):
+    return int(value is not None)
+
+
+def model_picture(outer_temperature):
+    return MODEL_PICTURES['n4' if outer_temperature is None else 'n4pro']
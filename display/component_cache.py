@@ -0,0 +1,88 @@
+import time
+
+from nextion import ENCODING, TERMINATOR
+
+# Length of the 0xFF 0xFF 0xFF command terminator
+TERMINATOR_LENGTH = len(TERMINATOR)
+
+
+class ComponentCache:
+    """Shadow model of the display component attributes, keyed by page and component.
+
+    Assignments like `nozzletemp.txt="25°C"` or `vis q5,1` are only passed on
+    when the value differs from what was last written on the current page.
+    Anything else (page changes, method calls, appends) is always sent.
+    Every component keeps its value together with the size of the command
+    that set it, values from command templates are compared without
+    rendering the command first.
+    """
+
+    def __init__(self):
+        self.page = None
+        self.pages = {}
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.started = time.monotonic()
+
+    def set_page(self, page):
+        # The display resets a page's components every time it is loaded
+        self.page = page
+        self.pages.pop(page, None)
+
+    def invalidate(self):
+        self.pages.clear()
+
+    def update(self, commands):
+        components = self.pages.setdefault(self.page, {})
+
+        for command in commands:
+            key, value = self._split(command)
+            size = len(command.encode(ENCODING)) + TERMINATOR_LENGTH
+            if key is not None:
+                components[key] = (value, size)
+
+            self.bytes_sent += size
+
+    def showing(self, key, value) -> bool:
+        """Whether the component `key` already shows `value`, counted as saved if so."""
+        shown = self.pages.setdefault(self.page, {}).get(key)
+        if shown is None or shown[0] != value:
+            return False
+
+        self.bytes_saved += shown[1]
+        return True
+
+    def shown(self, key, value, size):
+        """Record that `value` was sent to the component `key` with a `size` byte command."""
+        if key is not None:
+            self.pages.setdefault(self.page, {})[key] = (value, size)
+
+        self.bytes_sent += size
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+
+        return {
+            'bytes_sent': self.bytes_sent,
+            'bytes_saved': self.bytes_saved,
+            'sent_per_second': self.bytes_sent / elapsed,
+            'saved_per_second': self.bytes_saved / elapsed,
+        }
+
+    @staticmethod
+    def key(command):
+        return ComponentCache._split(command)[0]
+
+    @staticmethod
+    def _split(command):
+        if command.startswith('vis '):
+            key, _, value = command.partition(',')
+            return key, value
+
+        key, separator, value = command.partition('=')
+
+        # Appends and arithmetic assignments are not idempotent
+        if not separator or key.endswith(('+', '-', '*', '/')) or ' ' in key:
+            return None, None
+
+        return key, value
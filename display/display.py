@@ -1,3 +1,4 @@
+import os
 import serial
 import time
 import moonrakerpy as moonpy
@@ -5,12 +6,29 @@ import re
 import threading
 
 from response_actions import response_actions
+from status_thread import StatusThread
+from storage import JsonStore, STATE_DIR
+
+DEFAULT_BAUDRATE = 115200
+DISPLAY_BAUDRATE = 921600
+PROBE_TIMEOUT = 0.5
+
+MOONRAKER_HOST = '127.0.0.1'
+MOONRAKER_PORT = 7125
+
+# Seconds to wait for the first printer status at startup
+STATUS_TIMEOUT = 10
+
+display_state = JsonStore(os.path.join(STATE_DIR, 'display.json'))
 
 class NavigationController:
-    def __init__(self, printer, serial_device):
+    def __init__(self, printer, serial_device, status):
         self.history = ["page 1"]
         self.printer = printer
         self.serial_device = serial_device
+        self.status = status
+        # Text last written per component, only changes are sent
+        self.shown = {}
         self.part_light_state = False
         self.frame_light_state = False
         self.fan_state = False
@@ -29,20 +47,21 @@ class NavigationController:
         self.update_thread.start()
 
     def update_if_page1(self, print_to_terminal=False):
-        temps = self.printer.query_temperatures()
-        extruder = temps['extruder']['temperature']
-        bed = temps['heater_bed']['temperature']
-#        outbed = temps.get('heater_generic heater_bed_outer', {}).get('temperature', 'N/A')
-        toolhead = self.printer.query_status('toolhead')
-        x_pos = toolhead['position'][0]
-        y_pos = toolhead['position'][1]
-        z_pos = toolhead['position'][2]
-        self._write(f'nozzletemp.txt="{extruder}°C"', print_to_terminal)
-        self._write(f'bedtemp.txt="{bed}°C"', print_to_terminal)
-#        self._write(f'out_bedtemp.txt="{outbed}°C"', print_to_terminal)
-        self._write(f'x_pos.txt="{x_pos}"', print_to_terminal)
-        self._write(f'y_pos.txt="{y_pos}"', print_to_terminal)
-        self._write(f'z_pos.txt="{z_pos}"', print_to_terminal)
+        # Read from the subscription, no request to Moonraker
+        status = self.status.snapshot()
+        if not all(name in status for name in ('extruder', 'heater_bed', 'toolhead')):
+            return
+
+        extruder = status['extruder']['temperature']
+        bed = status['heater_bed']['temperature']
+#        outbed = status.get('heater_bed_outer', {}).get('temperature', 'N/A')
+        x_pos, y_pos, z_pos = status['toolhead']['position'][:3]
+        self._write_changed('nozzletemp.txt', f'"{extruder}°C"', print_to_terminal)
+        self._write_changed('bedtemp.txt', f'"{bed}°C"', print_to_terminal)
+#        self._write_changed('out_bedtemp.txt', f'"{outbed}°C"', print_to_terminal)
+        self._write_changed('x_pos.txt', f'"{x_pos}"', print_to_terminal)
+        self._write_changed('y_pos.txt', f'"{y_pos}"', print_to_terminal)
+        self._write_changed('z_pos.txt', f'"{z_pos}"', print_to_terminal)
 
     def _navigate_to_page(self, page):
         if self.history[-1] != page:
@@ -51,14 +70,9 @@ class NavigationController:
             print(f"Navigate to {page}. Current history: {self.history}")
 
     def printer_status(self):
-        temps = self.printer.query_temperatures()
-        extruder = temps['extruder']['temperature']
-        bed = temps['heater_bed']['temperature']
-#        outbed = temps['heater_generic heater_bed_outer']['temperature']
-        toolhead = self.printer.query_status('toolhead')
-        x_pos = toolhead['position'][0]
-        y_pos = toolhead['position'][1]
-        z_pos = toolhead['position'][2]
+        if not self.status.ready.wait(STATUS_TIMEOUT):
+            print("No printer status from Moonraker yet")
+
         self._write(f'main.q4.picc=213') # 213=N4 214=N4Pro
         self._write(f'main.disp_q5.val=1') # N4Pro Outer Bed Symbol (Bottom Rig>
         self._write(f'page 1')
@@ -66,17 +80,14 @@ class NavigationController:
         self._write(f'vis out_bedtemp,1') # Only N4Pro
         self._write(f'page 109')
         self._write(f'page 1')
-        self._write(f'nozzletemp.txt="{extruder}°C"')
-        self._write(f'bedtemp.txt="{bed}°C"')
-#        self._write(f'out_bedtemp.txt="{outbed}°C"')
-        self._write(f'x_pos.txt="{x_pos}"')
-        self._write(f'y_pos.txt="{y_pos}"')
+        self.shown.clear()
         self.update_if_page1()
 
     def move_axis(self, axis, distance):
-        self.printer.send_gcode('G91')  # Set to relative positioning
-        self.printer.send_gcode(f'G1 {axis}{distance}')  # Move axis
-        self.printer.send_gcode('G90')  # Set back to absolute positioning
+        # Relative positioning, move and back to absolute in one request
+        if not self.printer.send_gcode(f'G91\nG1 {axis}{distance}\nG90'):
+            # Klipper stops the script at the failed move, G90 did not run
+            self.printer.send_gcode('G90')
 
     def execute_action(self, action):
         if action.startswith("move_"):
@@ -143,8 +154,15 @@ class NavigationController:
             print("Already at the main page.")
 
     def _change_display(self, page):
+        # Components are reset when a page is loaded
+        self.shown.clear()
         self._write(page)
 
+    def _write_changed(self, component, value, print_to_terminal=True):
+        if self.shown.get(component) != value:
+            self.shown[component] = value
+            self._write(f'{component}={value}', print_to_terminal)
+
     def _write(self, data, print_to_terminal=True):
         if print_to_terminal:
             print(f"Write {data}")
@@ -152,25 +170,88 @@ class NavigationController:
         self.serial_device.write(str.encode(data))
         self.serial_device.write(serial.to_bytes(padding))
 
+def probe_display(serial_device):
+    # sendme is answered with 0x66 <page> 0xFF 0xFF 0xFF
+    timeout = serial_device.timeout
+    serial_device.timeout = PROBE_TIMEOUT
+    serial_device.reset_input_buffer()
+    serial_device.write(str.encode('sendme'))
+    serial_device.write(serial.to_bytes([0xFF, 0xFF, 0xFF]))
+    response = serial_device.read_until(serial.to_bytes([0xFF, 0xFF, 0xFF]))
+    serial_device.timeout = timeout
+    return response.startswith(b'\x66') and response.endswith(b'\xff\xff\xff')
+
+def set_baudrate(serial_device, baudrate):
+    serial_device.flush()
+    serial_device.baudrate = baudrate
+    serial_device.reset_input_buffer()
+
+def negotiate_baudrate(serial_device, baudrate=DISPLAY_BAUDRATE):
+    current = serial_device.baudrate
+
+    if not probe_display(serial_device):
+        if current == DEFAULT_BAUDRATE:
+            print(f"Display does not answer at {current} baud")
+            return current
+
+        current = DEFAULT_BAUDRATE
+        set_baudrate(serial_device, current)
+        if not probe_display(serial_device):
+            print(f"Display does not answer at {current} baud")
+            return current
+
+    if current == baudrate:
+        return current
+
+    serial_device.write(str.encode(f'baud={baudrate}'))
+    serial_device.write(serial.to_bytes([0xFF, 0xFF, 0xFF]))
+    set_baudrate(serial_device, baudrate)
+    time.sleep(0.05)
+
+    if probe_display(serial_device):
+        print(f"Display link running at {baudrate} baud")
+        return baudrate
+
+    print(f"Display does not answer at {baudrate} baud, falling back to {current}")
+    set_baudrate(serial_device, current)
+    return current
+
 def generate_key(readData):
     return ''.join(readData)
 
-def match_key(pattern, key):
-    return re.match(pattern.replace('??', '..'), key) is not None
+def compile_response_actions(actions):
+    """Split the table into exact keys and '??' wildcard patterns, keeping first match order."""
+    exact = {}
+    patterns = []
+    for key, action in actions.items():
+        if '??' in key:
+            patterns.append((re.compile(key.replace('??', '..')), action))
+        elif key not in exact and not any(pattern.match(key) for pattern, _ in patterns):
+            exact[key] = action
+    return exact, patterns
+
+exact_actions, pattern_actions = compile_response_actions(response_actions)
+
+def find_action(key):
+    action = exact_actions.get(key)
+    if action is None:
+        action = next((action for pattern, action in pattern_actions if pattern.match(key)), None)
+    return action
 
 def handle_response(readData, nav_controller):
-    action_key = generate_key(readData)
-    for key in response_actions.keys():
-        if match_key(key, action_key):
-            nav_controller.execute_action(response_actions[key])
-            break
+    action = find_action(generate_key(readData))
+    if action is not None:
+        nav_controller.execute_action(action)
     else:
         print("No action for response:", readData)
 
-printer = moonpy.MoonrakerPrinter('http://127.0.0.1')
-ser = serial.Serial("/dev/ttyS1", 115200, timeout=2, writeTimeout=0)
+printer = moonpy.MoonrakerPrinter(f'http://{MOONRAKER_HOST}')
+status = StatusThread(MOONRAKER_HOST, MOONRAKER_PORT)
+status.start()
+baudrate = display_state.load().get('baudrate', DEFAULT_BAUDRATE)
+ser = serial.Serial("/dev/ttyS1", baudrate, timeout=2, writeTimeout=0)
 
-nav_controller = NavigationController(printer, ser)
+nav_controller = NavigationController(printer, ser, status)
 nav_controller.start_continuous_update()
 
 print('Starting Up...')
@@ -179,6 +260,10 @@ try:
     ser.close()
     ser.open()
 
+    negotiated = negotiate_baudrate(ser)
+    if negotiated != baudrate:
+        display_state.update(baudrate=negotiated)
+
     nav_controller.execute_action("page 109")
     nav_controller.printer_status()
     nav_controller.execute_action("page 1")
@@ -1,14 +1,34 @@
 from __future__ import annotations
 import asyncio
-import datetime
+import contextlib
 import logging
-from deepmerge import always_merger
-
+import os
+import random
+import signal
+import time
+from collections import deque
+from urllib.parse import quote
+
+import aiohttp
 import serial_asyncio
 from moonraker_api import MoonrakerListener, MoonrakerClient
-from moonraker_api.const import WEBSOCKET_STATE_CONNECTED
-
+from moonraker_api.const import WEBSOCKET_STATE_CONNECTED, WEBSOCKET_STATE_STOPPED
+from moonraker_api.websockets.websocketclient import WebsocketRequest
+
+from action_table import compile_actions
+from component_cache import ComponentCache
+from jog import JogAccumulator
+from loop_monitor import LoopMonitor
+from metrics import HANDLER_STARTED, Metrics, MetricsServer
+from profiler import Profiler
+from nextion import (CommandBatch, CommandBuffer, DisplayEvent, NextionFrameParser, ENCODING, INSTRUCTION_RESULTS,
+                     STARTUP_PAYLOAD, TERMINATOR, encode_command)
+from refresh_scheduler import RefreshScheduler, SERIAL_BUDGET, serial_budget
 from response_actions2 import response_actions, DISPLAYINPUT
+from status_store import StatusStore
+from storage import JsonStore, STATE_DIR
+from thumbnails import Thumbnailer
+from traffic_log import TRAFFIC, TrafficRecorder
 import views
 
 logging.basicConfig(
@@ -25,6 +45,12 @@ VIEWS = [
     'PrepareMove',
     'PrepareTemp',
     'PrepareExtruder',
+    'Message',
+    'Settings',
+    'Level',
+    'PrintSettingsFilament',
+    'PrintSettingsSpeed',
+    'PrintSettingsAdjust',
 ]
 
 TEMPERATURE_SENSORS = [
@@ -33,30 +59,209 @@ TEMPERATURE_SENSORS = [
     'heater_bed_outer',
 ]
 
+# Seconds between component cache statistics log lines
+CACHE_STATS_INTERVAL = 60
+
+# Serial transport write buffer water marks in bytes
+WRITE_BUFFER_HIGH = 2048
+WRITE_BUFFER_LOW = 512
+
+# Queued display output after which senders wait for the transport to drain
+MAX_PENDING_BYTES = 4096
+
+# Commands the display may hold unanswered with bkcmd=3, it buffers 1 KB
+ACK_WINDOW = 16
+ACK_WINDOW_BYTES = 512
+
+# Seconds without a return code before in-flight commands are given up on
+ACK_TIMEOUT = 0.5
+
+# Resends of a command dropped with a buffer overflow, and the pause before them.
+# The commands written after it are resent with it, in their original order.
+ACK_RETRIES = 3
+ACK_RETRY_DELAY = 0.01
+
+# Commands the display answers with data instead of a return code
+QUERY_COMMANDS = ('sendme', 'get ')
+
+DISPLAY_DEVICE = '/dev/ttyS1'
+
+MOONRAKER_HOST = '127.0.0.1'
+MOONRAKER_PORT = 7125
+
+# Prometheus endpoint at /metrics and recent loop stalls at /stalls,
+# bind 0.0.0.0 to scrape from other hosts, a port of None turns it off
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9105
+
+# Starts a profile of the running service, sent again it stops it early
+PROFILE_SIGNAL = signal.SIGUSR1
+
+# Records all display and Moonraker traffic to this file for benchmarks/replay.py
+CAPTURE_FILE = None
+
+# Rate the display starts at after power on and the rate negotiated at startup
+DEFAULT_BAUDRATE = 115200
+DISPLAY_BAUDRATE = 921600
+
+# Seconds to wait for the display to answer a probe or to switch its baud rate
+PROBE_TIMEOUT = 0.5
+BAUD_SWITCH_DELAY = 0.05
+
+DISPLAY_STATE_FILE = os.path.join(STATE_DIR, 'display.json')
+
+# Last known printer state, drawn at the next start before Moonraker is up
+SNAPSHOT_FILE = os.path.join(STATE_DIR, 'snapshot.json')
+SNAPSHOT_INTERVAL = 300
+
+# Seconds a touch handler may run, motion handlers wait for the move to finish
+COMMAND_TIMEOUT = 30
+MOTION_TIMEOUT = 600
+
+# Seconds to wait for an RPC answer, printer.gcode.script only answers once
+# the gcode has been executed
+REQUEST_TIMEOUTS = {
+    'printer.gcode.script': MOTION_TIMEOUT,
+}
+
+# Seconds a file download from Moonraker may take
+DOWNLOAD_TIMEOUT = 10
+
+
+# Seconds before reconnecting a lost link, doubled per failed attempt
+RECONNECT_DELAY = 0.1
+RECONNECT_MAX_DELAY = 5
+
+
+class MoonrakerError(Exception):
+    pass
+
+
+class DisplayLinkLost(ConnectionError):
+    pass
+
+
+def command_size(command):
+    return len(command.encode(ENCODING)) + len(TERMINATOR)
+
+
+def reconnect_delay(attempt):
+    # Jitter keeps the links from retrying in lockstep after a shared outage
+    return min(RECONNECT_MAX_DELAY, RECONNECT_DELAY * 2 ** attempt) * random.uniform(0.5, 1)
+
 
 class NavigationController:
-    def __init__(self, event_loop, display, moonraker):
+    def __init__(self, event_loop, display, moonraker, budget=SERIAL_BUDGET, snapshot_file=SNAPSHOT_FILE,
+                 started=None, metrics=None, thumbnailer=None):
         self.loop = event_loop
         self.display = display
         self.moonraker = moonraker
+        self.metrics = Metrics() if metrics is None else metrics
+        self.touch_latency = self.metrics.histogram('display_touch_to_handler_seconds',
+                                                    'Time from a display frame arriving to its handler starting')
+        self.status_latency = self.metrics.histogram('display_status_to_serial_seconds',
+                                                     'Time from a status update to its redraw being queued for the display')
+        # Loop time of the oldest status update not yet redrawn, per binding
+        self.status_received = {}
         self.views = {}
         self.history = []
+        self.current_page = None
+        self.page_bindings = {}
+        self.binding_index = {}
+        self.scheduler = RefreshScheduler(event_loop, budget)
+        self.component_cache = ComponentCache()
+        self.cache_stats_logged = 0
+        self.tasks = set()
+        self.motion_tasks = set()
+        # Motion tasks stopped by cancel_motion, as opposed to a shutdown
+        self.cancelled_motion = set()
+        self.motion_lock = asyncio.Lock()
+        self.gcode_latency = self.metrics.histogram('display_handler_to_gcode_seconds',
+                                                    'Time from a handler starting to its gcode being sent to Moonraker')
+        self.jog_accumulator = JogAccumulator(self)
+        self.snapshot_store = JsonStore(snapshot_file)
+        self.started = time.monotonic() if started is None else started
+        self.startup_time = None
+        self.warm_start = False
+        self.thumbnailer = Thumbnailer(event_loop) if thumbnailer is None else thumbnailer
 
         for view_name in VIEWS:
             view = getattr(views, view_name)
             self.views[view_name] = view(event_loop, self, moonraker)
 
-    async def startup(self):
-        await self.views['Prepare'].show()
+            for page, bindings in view.bindings.items():
+                self.page_bindings.setdefault(page, []).extend(bindings)
 
-        while True:
-            printer_ready = await self._is_printer_ready()
-            websocket_ready = self.moonraker.is_connected
-            if printer_ready and websocket_ready and self.moonraker.printer_status:
-                break
-            await asyncio.sleep(1)
+        # Bindings by (object, field) input, so an update only re-renders what it affects
+        for page, bindings in self.page_bindings.items():
+            index = self.binding_index[page] = {}
+            for binding in bindings:
+                for status_input in binding.inputs:
+                    index.setdefault(status_input, []).append(binding)
+
+        # Raises on a bad table, before the display is touched
+        self.actions = compile_actions(response_actions, self.views, self)
+
+        moonraker.add_notification_handler('notify_status_update', self._on_status_update)
 
-        await self._render_navigation()
+        self.metrics.add_collector('display_component_cache', self.component_cache.stats)
+        self.metrics.add_collector('display_refresh', self.scheduler.stats)
+        self.metrics.add_collector('display_serial', display.ack_stats)
+        self.metrics.add_collector('moonraker_status', moonraker.status_store.stats)
+
+    async def show_splash(self):
+        """Draw the home screen from the last snapshot, or the boot page without one."""
+        snapshot = self.snapshot_store.load()
+        if not snapshot.get('printer_status'):
+            await self.views['Prepare'].show()
+            return
+
+        self.moonraker.printer_status = snapshot['printer_status']
+        self.views['Print'].restore(snapshot.get('print', {}))
+        self.warm_start = True
+
+        await self._show_home()
+        self._log_startup('cached snapshot')
+
+    async def startup(self):
+        if self.startup_time is None:
+            await self.moonraker.klippy_ready.wait()
+            await self._show_home()
+            self._log_startup('live data')
+
+        await asyncio.gather(self._input_loop(), self._status_loop(), self._snapshot_loop())
+
+    async def close(self):
+        """Cancel and wait for the handler, jog and view tasks still running."""
+        tasks = set(self.tasks)
+        if self.jog_accumulator.task is not None:
+            tasks.add(self.jog_accumulator.task)
+        for view in self.views.values():
+            tasks.update(view.tasks())
+
+        tasks = [task for task in tasks if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def redraw(self):
+        """Draw the home screen again after the display link was reopened."""
+        self.component_cache.invalidate()
+        self.history.clear()
+
+        if self.moonraker.printer_status:
+            await self._show_home()
+        else:
+            await self.views['Prepare'].show()
+
+    def save_snapshot(self):
+        try:
+            self.snapshot_store.save({
+                'printer_status': self.moonraker.printer_status,
+                'print': self.views['Print'].snapshot(),
+            })
+        except OSError as e:
+            _LOGGER.error("Could not save snapshot: %s", repr(e))
 
     async def page(self, page_number, with_history=True):
         if not self.history or self.history[-1] != page_number:
@@ -64,7 +269,12 @@ class NavigationController:
                 self.history.append(page_number)
 
         await self.display.send_data(f"page {page_number}")
+        self.current_page = page_number
+        self.component_cache.set_page(page_number)
+        self.scheduler.clear()
+        self.status_received.clear()
         _LOGGER.debug("Navigating to page %s", page_number)
+        self.request_render()
 
     async def page_back(self):
         if len(self.history) > 1:
@@ -74,142 +284,364 @@ class NavigationController:
         else:
             print("Already at the main page.")
 
+    def request_render(self):
+        """Redraw all status fields of the current page straight away."""
+        self.scheduler.schedule(self.page_bindings.get(self.current_page, ()), urgent=True)
+
+    # Writes made for the user go out at once, status redraws make room for them
+
     async def send_data(self, data):
+        self.scheduler.consume(command_size(data))
         await self.display.send_data(data)
 
     async def send_cmd(self, data):
+        self.component_cache.update([data])
+        self.scheduler.consume(command_size(data))
         await self.display.send_cmd(data)
 
     async def send_cmds(self, data):
+        self.component_cache.update(data)
+        self.scheduler.consume(sum(command_size(command) for command in data))
         await self.display.send_cmds(data)
 
-    async def send_gcode(self, gcode):
-        await self.moonraker.call_method('printer.gcode.script', script=gcode)
-
-    async def update_printer_status(self):
-        update_commands = []
-        status = self.moonraker.printer_status
-
-        toolhead = status['toolhead']
-
-        update_commands.append(f'nozzletemp.txt="{int(status["extruder"]["temperature"])}°C"')
-        update_commands.append(f'nozzletemp_t.txt="{int(status["extruder"]["target"])}°C"')
-        update_commands.append(f'bedtemp.txt="{int(status["heater_bed"]["temperature"])}°C"')
-        update_commands.append(f'bedtemp_t.txt="{int(status["heater_bed"]["target"])}°C"')
-
-        show_outer_bed = False
-        if 'temperature' in status['heater_bed_outer']:
-            show_outer_bed = True
-            update_commands.append(f'out_bedtemp.txt="{int(status["heater_bed_outer"]["temperature"])}°C"')
-            update_commands.append(f'out_bedtemp_t.txt="{int(status["heater_bed_outer"]["target"])}°C"')
-
-        update_commands.append(f'vis q5,{int(show_outer_bed)}')
-        update_commands.append(f'vis out_bedtemp,{int(show_outer_bed)}')
-
-        update_commands.append(f'x_pos.txt="{int(toolhead["position"][0])}"')
-        update_commands.append(f'y_pos.txt="{int(toolhead["position"][1])}"')
-        update_commands.append(f'z_pos.txt="{int(toolhead["position"][2])}"')
-
-        print_stats = status['print_stats']
-        gcode_move = status['gcode_move']
-        if print_stats['state'] == 'printing':
-            update_commands.append(f'p0.pic=68')
-            update_commands.append(f'vis cp0,0')
-            update_commands.append(f't0.txt="{print_stats["filename"]}')
-            update_commands.append(f'printpause.cp0.close()')
-            update_commands.append(f'x_pos.txt="X[{int(gcode_move["position"][0])}]')
-            update_commands.append(f'y_pos.txt="Y[{int(gcode_move["position"][1])}]"')
-            update_commands.append(
-                f'nozzletemp.txt="{int(status["extruder"]["temperature"])}/{int(status["extruder"]["target"])}"')
-            update_commands.append(f'fanspeed.txt="{int(status["fan"]["speed"])}%"')
-            update_commands.append(f'flow_speed.txt="100%"')
-            update_commands.append(f'zvalue.txt="{int(gcode_move["position"][2])}"')
-            update_commands.append(f'printspeed.txt="100%"')
-            update_commands.append(f'printtime.txt="{str(datetime.timedelta(seconds=print_stats["print_duration"]))}"')
-            update_commands.append(f't7.txt="{str(datetime.timedelta(seconds=print_stats["total_duration"]))}"')
-            update_commands.append(f'printvalue.txt="0"')
-            update_commands.append(f'pressure_val.txt="{int(gcode_move["speed"])}mm/s"')
-
-        await self.send_cmds(update_commands)
-
-    async def _render_navigation(self):
-        status = self.moonraker.printer_status
-
-        if status['print_stats']['state'] != 'printing':
+    async def send_gcode(self, *gcodes):
+        """Run the gcode lines of one action as a single printer.gcode.script call.
+
+        Lines of different handlers are never combined, Klipper stops a script
+        at its first error and a quick command would wait behind a long move.
+        """
+        if not gcodes:
+            return None
+
+        started = HANDLER_STARTED.get()
+        if started is not None:
+            self.gcode_latency.observe(self.loop.time() - started)
+
+        return await self.call_method('printer.gcode.script', script='\n'.join(gcodes))
+
+    async def jog(self, axis, distance):
+        """Queue a relative move and show the predicted position straight away."""
+        toolhead = self.moonraker.printer_status['toolhead']
+        self.jog_accumulator.add(axis, distance, toolhead['position'])
+
+        position = self.jog_accumulator.predicted_position(toolhead['position'])
+        await self.send_cmd(f'{axis}_pos.txt="{int(position["xyz".index(axis)])}"')
+
+    async def call_method(self, method, **kwargs):
+        """Moonraker RPC for a handler, an error answer raises MoonrakerError and is shown."""
+        response = await self.moonraker.call_method(method, **kwargs)
+
+        if isinstance(response, dict) and 'error' in response:
+            raise MoonrakerError(response['error'].get('message', repr(response['error'])))
+
+        return response
+
+    async def show_error(self, message):
+        _LOGGER.error(message)
+        await self.views['Message'].show(message)
+
+    def cancel_motion(self):
+        """Stop the running move and drop the queued ones."""
+        tasks = set(self.motion_tasks)
+        if self.jog_accumulator.task is not None and not self.jog_accumulator.task.done():
+            tasks.add(self.jog_accumulator.task)
+
+        for task in tasks:
+            task.cancel()
+            self.cancelled_motion.add(task)
+            task.add_done_callback(self.cancelled_motion.discard)
+
+    async def show_cancelled(self, name):
+        """Tell the user a move was cancelled, unless the service is shutting down."""
+        if asyncio.current_task() not in self.cancelled_motion:
+            return
+
+        _LOGGER.info("Cancelled %s", name)
+        await self.views['Message'].show(f"{name} cancelled")
+
+    async def update_printer_status(self, bindings):
+        size, received = self.render_status(bindings)
+
+        if size:
+            self.scheduler.consume(size)
+            await self.display.send_output()
+
+            now = self.loop.time()
+            for updated in received:
+                self.status_latency.observe(now - updated)
+
+    def render_status(self, bindings) -> tuple[int, list[float]]:
+        """Render changed fields into the display output.
+
+        Returns the bytes rendered and when the updates they show arrived.
+        """
+        output = self.display.output
+        received = []
+        size = 0
+        for binding in bindings:
+            value = binding.value(self._status_value)
+            updated = self.status_received.pop(binding, None)
+
+            # Fields whose value did not change cost nothing
+            command_bytes = 0
+            if value is not None and not self.component_cache.showing(binding.key, value):
+                command_bytes = binding.command.render(output, value)
+                self.component_cache.shown(binding.key, value, command_bytes)
+                if updated is not None:
+                    received.append(updated)
+
+            self.scheduler.sent(binding, command_bytes)
+            size += command_bytes
+
+        return size, received
+
+    def _status_value(self, name, field):
+        value = self.moonraker.printer_status.get(name, {}).get(field)
+
+        # While jogging show where the toolhead is heading, not where it was last reported
+        if (name, field) == ('toolhead', 'position') and value is not None:
+            value = self.jog_accumulator.predicted_position(value)
+
+        return value
+
+    async def _show_home(self):
+        if self.moonraker.printer_status['print_stats']['state'] != 'printing':
             await self.views['Main'].show()
         else:
             await self.views['Print'].print_status()
 
+    def _log_startup(self, source):
+        self.startup_time = time.monotonic() - self.started
+        _LOGGER.info("First usable screen after %.2f s from %s", self.startup_time, source)
+
+    async def _input_loop(self):
         while True:
-            await self.update_printer_status()
-            command = self.display.get_command()
+            command = await self.display.read_command()
 
-            if not command:
-                await asyncio.sleep(0.5)
-                continue
+            # Handlers run as tasks so a long gcode call does not block input
+            task = self.loop.create_task(self._handle_command(command))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _status_loop(self):
+        while True:
+            bindings = await self.scheduler.next_due()
+            await self.update_printer_status(bindings)
+            self._log_cache_stats()
 
-            await self._handle_command(command)
-            await asyncio.sleep(0.5)
+    async def _snapshot_loop(self):
+        await self.moonraker.klippy_ready.wait()
+        _LOGGER.info("Live printer data after %.2f s", time.monotonic() - self.started)
 
-    def _split_command(self, command):
-        # Types:
-        # 65 Button pushed
-        # 71 Text input
-        # 21 ACK
+        # A cached home screen may be showing the wrong print state
+        if self.warm_start and len(self.history) <= 1:
+            await self._show_home()
 
         try:
-            data = {
-                "type": DISPLAYINPUT(command[0]),
-                "page": int(command[1]),
-                "action": int(command[2]),
-                "value": int(command[3])
-            }
-
-            if data['type'] == DISPLAYINPUT.ACK:
-                return
-
-            _LOGGER.debug('Split command data to %s', repr(data))
-            return data
-        except ValueError as e:
-            print(repr(e))
-            _LOGGER.error('Command not implemented %s', command)
+            await self.views['Print'].refresh_files()
+        except Exception as e:
+            _LOGGER.error("Could not load the file list: %s", repr(e))
 
-    async def _handle_command(self, command) -> None:
-        # _LOGGER.debug('Handling command %s', command)
-        command_data = self._split_command(command)
+        while True:
+            self.save_snapshot()
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+    def _on_status_update(self, data):
+        changed = self.moonraker.status_store.take_changed()
+        index = self.binding_index.get(self.current_page, {})
+        bindings = dict.fromkeys(binding for status_input in changed for binding in index.get(status_input, ()))
+
+        now = self.loop.time()
+        for binding in bindings:
+            self.status_received.setdefault(binding, now)
+        self.scheduler.schedule(bindings)
+
+    def _log_cache_stats(self):
+        now = self.loop.time()
+        if now - self.cache_stats_logged < CACHE_STATS_INTERVAL:
+            return
+
+        self.cache_stats_logged = now
+        stats = self.component_cache.stats()
+        _LOGGER.debug("Display traffic %.1f B/s sent, %.1f B/s saved by component cache",
+                      stats['sent_per_second'], stats['saved_per_second'])
+
+        stats = self.moonraker.status_store.stats()
+        _LOGGER.debug("Status updates %s, %s fields changed, %s unchanged",
+                      stats['updates'], stats['fields_changed'], stats['fields_unchanged'])
+
+        stats = self.scheduler.stats()
+        _LOGGER.debug("Refresh scheduler %s fields queued, deferred %s times for the serial budget",
+                      stats['queued'], stats['deferred'])
 
-        if not command_data or command_data['type'] == DISPLAYINPUT.ACK:
+        stats = self.display.ack_stats()
+        _LOGGER.debug("Display acknowledged %s commands, %s retried, %s rejected, %s unanswered",
+                      stats['acks'], stats['retries'], stats['errors'], stats['timeouts'])
+
+        _LOGGER.debug("Latency p95 touch to handler %s s, status to serial %s s",
+                      self.touch_latency.quantile(0.95), self.status_latency.quantile(0.95))
+
+    async def _handle_command(self, command) -> None:
+        if command.type != DISPLAYINPUT.BUTTON and command.type != DISPLAYINPUT.TEXT:
+            if command.type != DISPLAYINPUT.SUCCESS:
+                _LOGGER.debug('Display returned %s', repr(command))
             return
 
-        try:
-            signature = response_actions[command_data['page']][command_data['type']][command_data['action']]
-            view = signature[0]
-            method = signature[1]
+        _LOGGER.debug('Handling command %s', repr(command))
 
-            if command_data['type'] == DISPLAYINPUT.TEXT:
-                arguments = [command_data['value']]
-            else:
-                arguments = signature[2:]
+        action = self.actions.lookup(command.page, command.type, command.action)
+        if action is None:
+            _LOGGER.error("No action for response: %s", repr(command))
+            return
 
-            func = getattr(self.views[view], method)
+        started = self.loop.time()
+        HANDLER_STARTED.set(started)
+        if command.received is not None:
+            self.touch_latency.observe(started - command.received)
 
-            _LOGGER.debug(f"Execute command {signature}")
-            await func(*arguments)
+        signature, func, arguments = action.signature, action.func, action.arguments_for(command)
+        _LOGGER.debug(f"Execute command {signature}")
 
-        except (KeyError, TypeError) as e:
-            print(repr(e))
-            _LOGGER.error("No action for response: %s", repr(command_data))
+        if not action.motion:
+            await self._execute(signature, func, arguments, COMMAND_TIMEOUT)
+            return
 
-    async def _is_printer_ready(self) -> bool:
-        return await self.moonraker.get_klipper_status() == 'ready'
+        # Motion commands are executed one after another in arrival order
+        task = asyncio.current_task()
+        self.motion_tasks.add(task)
+        try:
+            async with self.motion_lock:
+                await self._execute(signature, func, arguments, MOTION_TIMEOUT)
+        finally:
+            self.motion_tasks.discard(task)
 
+    async def _execute(self, signature, func, arguments, timeout):
+        try:
+            await asyncio.wait_for(func(*arguments), timeout)
+        except asyncio.TimeoutError:
+            await self.show_error(f"{signature[1]} timed out after {timeout}s")
+        except MoonrakerError as e:
+            await self.show_error(str(e))
+        except asyncio.CancelledError:
+            _LOGGER.debug(f"Cancelled command {signature}")
+            await self.show_cancelled(signature[1])
+            raise
+        except Exception as e:
+            _LOGGER.exception(f"Command {signature} failed")
+            await self.show_error(repr(e))
 
-class MoonrakerController(MoonrakerListener, MoonrakerClient):
-    printer_status = {}
 
-    def __init__(self, event_loop):
-        super().__init__(listener=self, host='127.0.0.1', loop=event_loop)
+class MoonrakerController(MoonrakerListener, MoonrakerClient):
+    def __init__(self, event_loop, host=MOONRAKER_HOST, port=MOONRAKER_PORT, metrics=None, recorder=None):
+        super().__init__(listener=self, host=host, port=port, loop=event_loop)
         self.loop = event_loop
+        self.metrics = Metrics() if metrics is None else metrics
+        self.recorder = recorder
+        self.notification_handlers = {}
+        # Called on every websocket (re)connect, notifications sent meanwhile are lost
+        self.connect_handlers = []
+        self.status_store = StatusStore()
+        self.klippy_ready = asyncio.Event()
+        self.disconnected_at = None
+
+    async def _request(self, method, **kwargs):
+        # Same as WebsocketClient._request with a per method timeout
+        req_id, data = self._build_websocket_request(method, **kwargs)
+        req = WebsocketRequest(req_id, data, timeout=REQUEST_TIMEOUTS.get(method, self._timeout), loop=self._loop)
+        await self._requests_pending.put(req)
+        return req
+
+    async def call_method(self, method, **kwargs):
+        """Same as MoonrakerClient.call_method, timed per RPC method."""
+        if self.recorder is not None:
+            self.recorder.record_json(TRAFFIC.RPC_REQUEST, method, kwargs)
+
+        started = self.loop.time()
+        outcome = 'error'
+        try:
+            response = await super().call_method(method, **kwargs)
+            if self.recorder is not None:
+                self.recorder.record_json(TRAFFIC.RPC_RESULT, method, response)
+
+            if not (isinstance(response, dict) and 'error' in response):
+                outcome = 'ok'
+            return response
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            raise
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        finally:
+            elapsed = self.loop.time() - started
+            self.metrics.histogram('moonraker_rpc_seconds', 'Moonraker RPC round trip time',
+                                   method=method).observe(elapsed)
+            if outcome != 'ok':
+                self.metrics.increment('moonraker_rpc_failures_total', 'Moonraker RPCs without a result',
+                                       method=method, outcome=outcome)
+            _LOGGER.debug("RPC %s %s after %.1f ms", method, outcome, elapsed * 1000)
+
+    async def download_file(self, root, path) -> bytes:
+        """Read a file of a Moonraker root over HTTP, the host need not be this machine."""
+        if self.session is None:
+            raise ConnectionError('Not connected to Moonraker')
+
+        scheme = 'https' if self.ssl else 'http'
+        prefix = f'/{self.route_prefix.strip("/")}' if self.route_prefix else ''
+        url = f'{scheme}://{self.host}:{self.port}{prefix}/server/files/{root}/{quote(path)}'
+        headers = {'X-Api-Key': self.api_key} if self.api_key else None
+
+        try:
+            async with self.session.get(url, headers=headers,
+                                        timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)) as response:
+                response.raise_for_status()
+                return await response.read()
+        except aiohttp.ClientError as e:
+            raise OSError(f'Could not download {url}: {e}') from e
+
+    @property
+    def printer_status(self):
+        return self.status_store.status
+
+    @printer_status.setter
+    def printer_status(self, status):
+        self.status_store.replace(status)
+
+    async def run(self):
+        """Keep the websocket connected, reconnecting with jittered backoff."""
+        attempt = 0
+        try:
+            while True:
+                try:
+                    await self.connect()
+                    attempt = 0
+                except Exception as e:
+                    _LOGGER.warning("Could not connect to Moonraker: %s", repr(e))
+
+                # Returns once the connection is gone. Cancelling the run task itself would
+                # leave its send loop behind, disconnect() below lets it finish instead.
+                await asyncio.wait([self._runtask])
+
+                await asyncio.sleep(reconnect_delay(attempt))
+                attempt += 1
+        finally:
+            try:
+                await self.disconnect()
+            finally:
+                # MoonrakerClient opens a session on the first connect and never closes it
+                if self.session is not None:
+                    await self.session.close()
+                    self.session = None
+
+    def add_notification_handler(self, method, handler):
+        self.notification_handlers.setdefault(method, []).append(handler)
+
+    def add_connect_handler(self, handler):
+        self.connect_handlers.append(handler)
+
+    def _dispatch_notification(self, method, data):
+        for handler in self.notification_handlers.get(method, []):
+            handler(data)
 
     async def query_printer(self, **kwargs):
         response = await self.call_method('printer.objects.query', **kwargs)
@@ -243,54 +675,161 @@ class MoonrakerController(MoonrakerListener, MoonrakerClient):
         return response['status']
 
     async def state_changed(self, state: str) -> None:
+        if self.recorder is not None:
+            self.recorder.record(TRAFFIC.STATE, state.encode('utf-8'))
+
         if state == WEBSOCKET_STATE_CONNECTED:
-            objects = {'toolhead': None, 'print_stats': None, 'fan': None, 'gcode_move': None}
+            for handler in self.connect_handlers:
+                handler()
+
+            # Klippy may have been ready before we connected, there is no event for that
+            if await self.get_klipper_status() == 'ready':
+                await self._klippy_ready()
+        elif state == WEBSOCKET_STATE_STOPPED:
+            self._klippy_lost()
+
+    async def _klippy_ready(self):
+        objects = {'toolhead': None, 'print_stats': None, 'fan': None, 'gcode_move': None}
+
+        for sensor in TEMPERATURE_SENSORS:
+            objects[sensor] = None
+
+        # Replaces the cached status, the component cache keeps the redraw to what changed
+        self.printer_status = await self.subscribe_printer(objects=objects)
+        self._dispatch_notification('notify_status_update', [self.printer_status])
+        self.klippy_ready.set()
 
-            for sensor in TEMPERATURE_SENSORS:
-                objects[sensor] = None
+        if self.disconnected_at is not None:
+            _LOGGER.info("Printer back after %.2f s", time.monotonic() - self.disconnected_at)
+            self.disconnected_at = None
 
-            self.printer_status = await self.subscribe_printer(objects=objects)
+    def _klippy_lost(self):
+        if self.klippy_ready.is_set():
+            self.disconnected_at = time.monotonic()
+        self.klippy_ready.clear()
 
     async def on_notification(self, method: str, data) -> None:
         """Notifies of state updates."""
 
         # _LOGGER.debug("Received notification %s -> %s", method, data)
 
+        if self.recorder is not None:
+            self.recorder.record_json(TRAFFIC.NOTIFICATION, method, data)
+
         # Subscription notifications
         if method == "notify_status_update":
-            message = data[0]
-            self.printer_status = always_merger.merge(self.printer_status, message)
+            self.status_store.update(data[0])
+        elif method == 'notify_klippy_ready':
+            await self._klippy_ready()
+        elif method in ('notify_klippy_shutdown', 'notify_klippy_disconnected'):
+            self._klippy_lost()
+
+        self._dispatch_notification(method, data)
 
 
 class DisplayController(asyncio.Protocol):
+    """Serial link to the display.
+
+    Commands are encoded into the reusable `output` buffer and queued as
+    batches, which go to the transport whole. Once bkcmd return codes are
+    enabled, every written command stays in flight until the display
+    answers it and no more than ACK_WINDOW commands are in flight at a
+    time, so the display's input buffer cannot overflow.
+    """
+
     def __init__(self):
-        self.command_queue = []
-        self.buffer = b''
+        self.command_queue = asyncio.Queue()
+        self.parser = NextionFrameParser()
         self.transport = None
+        self.loop = None
+        self.output = CommandBuffer()
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.in_flight = deque()
+        self.in_flight_count = 0
+        self.in_flight_bytes = 0
+        self.acknowledged = False
+        self.ack_timer = None
+        self.retry_timer = None
+        # Commands from the first one dropped with a buffer overflow on, as (frame, attempts, dropped)
+        self.resend = None
+        # Return codes are ignored after a timeout until the display answers a sendme
+        self.resyncing = False
+        self.ack_waiters = []
+        self.acks = 0
+        self.retries = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.flush_scheduled = False
+        self.writing_paused = False
+        self.drain_waiters = []
+        self.page_waiters = []
+        self.connected = asyncio.Event()
+        self.lost = asyncio.Event()
+        self.recorder = None
 
     def connection_made(self, transport):
         self.transport = transport
-        transport.serial.rts = False  # You can manipulate Serial object via transport
+        self.loop = asyncio.get_running_loop()
+        try:
+            transport.serial.rts = False  # You can manipulate Serial object via transport
+        except OSError:
+            # Pseudo terminals have no modem control lines
+            pass
+        transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH, low=WRITE_BUFFER_LOW)
+        self.parser.reset()
+        self.lost.clear()
+        self.connected.set()
+
+    async def read_command(self) -> DisplayEvent:
+        return await self.command_queue.get()
 
-    def get_command(self) -> str | None:
-        if not self.command_queue:
-            return None
+    def data_received(self, data) -> None:
+        if self.recorder is not None:
+            self.recorder.record(TRAFFIC.SERIAL_IN, data)
 
-        return self.command_queue.pop()
+        received = self.loop.time()
+        for event in self.parser.feed(data):
+            if event.type == DISPLAYINPUT.INVALID_INSTRUCTION and event.payload == STARTUP_PAYLOAD:
+                self._restarted()
+                continue
 
-    def data_received(self, data) -> None:
-        # self.buffer += data
+            if event.type in INSTRUCTION_RESULTS and self.acknowledged:
+                self._acknowledge(event)
+                continue
+
+            if event.type == DISPLAYINPUT.PAGE and self.resyncing:
+                self._resynced()
 
-        #while len(self.buffer) >= 6:
-        #    command = self.buffer[0:6]
-        #    self.buffer = self.buffer[6:]
-        #    print('data received split commands', command, repr(self.buffer))
+            if event.type == DISPLAYINPUT.PAGE and self.page_waiters:
+                waiters, self.page_waiters = self.page_waiters, []
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(event.page)
+                continue
 
-        self.command_queue.append(data)
+            self.command_queue.put_nowait(event._replace(received=received))
 
     def connection_lost(self, exc) -> None:
-        print('port closed')
-        self.transport.loop.stop()
+        _LOGGER.warning("Display link lost: %s", repr(exc))
+        self.transport = None
+        self.writing_paused = False
+        self.connected.clear()
+        self.lost.set()
+
+        # Return codes are enabled again once the link is reopened
+        self.acknowledged = False
+        self._release_in_flight()
+
+        # Output queued for the old link is dropped, the page is redrawn on reconnect
+        self._flush()
+
+    def pause_writing(self) -> None:
+        self.writing_paused = True
+
+    def resume_writing(self) -> None:
+        self.writing_paused = False
+        self._flush()
 
     async def send_data(self, data):
         await self.send(data)
@@ -302,35 +841,482 @@ class DisplayController(asyncio.Protocol):
         if not isinstance(commands, list):
             commands = [commands]
 
-        command_queue = bytearray()
-        padding = [0xFF, 0xFF, 0xFF]
-
         for command in commands:
-            command_queue.extend(str.encode(command))
-            command_queue.extend(bytes(padding))
+            self._write_command(command)
 
-        self.transport.serial.write(bytes(command_queue))
+        await self.send_output()
 
     async def send(self, data) -> None:
-        padding = [0xFF, 0xFF, 0xFF]
-        self.transport.serial.write(bytes(str.encode(data)))
-        self.transport.serial.write(bytes(bytearray(padding)))
-        await asyncio.sleep(0.05)
+        self._write_command(data)
+        await self.send_output()
+
+    async def send_output(self) -> None:
+        """Send the commands rendered into `output`."""
+        self._queue(self.output.take())
+        await self._schedule_flush()
+
+    async def drain(self) -> None:
+        """Wait until all queued output has been handed to the serial port."""
+        while self.pending or self.writing_paused:
+            waiter = self.loop.create_future()
+            self.drain_waiters.append(waiter)
+            await waiter
+
+    async def wait_acknowledged(self) -> None:
+        """Wait until the display has answered every command in flight."""
+        await self.drain()
+        while self.in_flight:
+            waiter = self.loop.create_future()
+            self.ack_waiters.append(waiter)
+            await waiter
+
+    async def enable_acknowledgements(self) -> bool:
+        """Turn on bkcmd=3 return codes and track writes against them.
+
+        Stays with unacknowledged writes when the display does not answer.
+        """
+        self.acknowledged = False
+        await self.send('bkcmd=3')
+
+        # Return codes for everything sent before arrive ahead of the page reply
+        if not await self.probe():
+            return False
+
+        acks = self.acks
+        self.acknowledged = True
+        await self.send('bkcmd=3')
+        await self.wait_acknowledged()
+
+        if self.acks == acks:
+            _LOGGER.warning("Display does not return bkcmd codes, writes are not acknowledged")
+            self.acknowledged = False
+            return False
+
+        return True
+
+    def ack_stats(self) -> dict:
+        return {
+            'acks': self.acks,
+            'retries': self.retries,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'in_flight': self.in_flight_count,
+        }
+
+    async def probe(self, timeout=PROBE_TIMEOUT) -> bool:
+        """Check the link by asking the display for its current page."""
+        waiter = self.loop.create_future()
+        self.page_waiters.append(waiter)
+        await self.send('sendme')
 
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            # No answer because the port is gone is not a display at another baud rate
+            self._serial()
+            return False
+
+    async def negotiate_baudrate(self, baudrate=DISPLAY_BAUDRATE) -> int:
+        """Switch the display and the serial port to `baudrate`.
+
+        Falls back to DEFAULT_BAUDRATE when the display does not answer at the
+        faster rate. Returns the rate the link ended up at.
+        """
+        current = self._serial().baudrate
+
+        if not await self.probe():
+            # The display was power cycled and is back at its default rate
+            if current == DEFAULT_BAUDRATE:
+                _LOGGER.warning("Display does not answer at %s baud", current)
+                return current
+
+            await self._set_baudrate(DEFAULT_BAUDRATE)
+            current = DEFAULT_BAUDRATE
+            if not await self.probe():
+                _LOGGER.warning("Display does not answer at %s baud", current)
+                return current
+
+        if current == baudrate:
+            return current
+
+        await self.send(f'baud={baudrate}')
+        await self._set_baudrate(baudrate)
+        await asyncio.sleep(BAUD_SWITCH_DELAY)
+
+        if await self.probe():
+            _LOGGER.info("Display link running at %s baud", baudrate)
+            return baudrate
+
+        _LOGGER.warning("Display does not answer at %s baud, falling back to %s", baudrate, current)
+        await self._set_baudrate(current)
+        return current
+
+    async def _set_baudrate(self, baudrate):
+        # Everything queued so far has to leave at the old rate
+        await self.drain()
+        while self._serial() and self.transport.get_write_buffer_size():
+            await asyncio.sleep(0.001)
+
+        serial = self._serial()
+        serial.flush()
+        serial.baudrate = baudrate
+        self.parser.reset()
+
+    def _serial(self):
+        # The link can be lost at every await while it is being set up
+        if self.transport is None:
+            raise DisplayLinkLost('Display link lost while setting it up')
+        return self.transport.serial
+
+    async def _schedule_flush(self):
+        # Commands queued in the same loop iteration go out as one write
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+        if self.pending_bytes >= MAX_PENDING_BYTES or self.writing_paused:
+            await self.drain()
+
+    def _write_command(self, command):
+        if command.startswith(QUERY_COMMANDS):
+            # Goes out as its own batch so it is not waited on for a return code
+            self._queue(self.output.take())
+            self._queue(CommandBatch.command(encode_command(command), acknowledged=False))
+            if command.startswith('get '):
+                self.parser.queries += 1
+            return
+
+        self.output.write(command.encode(ENCODING), b'', TERMINATOR)
+
+    def _queue(self, batch):
+        if batch is not None:
+            self.pending.append(batch)
+            self.pending_bytes += len(batch.data)
+
+    def _window_room(self, batch) -> int:
+        """Number of the batch's unsent commands the acknowledgement window takes."""
+        if not (self.acknowledged and batch.acknowledged):
+            return len(batch.ends) - batch.sent
+
+        count = self.in_flight_count
+        size = self.in_flight_bytes
+        start = batch.start(batch.sent)
+        for index in range(batch.sent, len(batch.ends)):
+            end = batch.ends[index]
+            # A single command always fits once nothing is in flight
+            if count and (count >= ACK_WINDOW or size + end - start > ACK_WINDOW_BYTES):
+                break
+            count += 1
+            size += end - start
+            start = end
+
+        return count - self.in_flight_count
+
+    def _flush(self):
+        self.flush_scheduled = False
+
+        if self.transport is None:
+            self.pending.clear()
+            self.pending_bytes = 0
+        elif (self.pending and not self.writing_paused and self.retry_timer is None
+              and self.resend is None and not self.resyncing):
+            chunks = []
+            while self.pending:
+                batch = self.pending[0]
+                first = batch.sent
+                count = self._window_room(batch)
+                if not count:
+                    break
+
+                batch.sent += count
+                start, end = batch.start(first), batch.ends[batch.sent - 1]
+                # Whole batches are handed over as they are, without a copy
+                chunks.append(batch.data if end - start == len(batch.data) else batch.data[start:end])
+                self.pending_bytes -= end - start
+
+                if self.acknowledged and batch.acknowledged:
+                    self.in_flight.append([batch, first, batch.sent])
+                    self.in_flight_count += count
+                    self.in_flight_bytes += end - start
+
+                if batch.sent < len(batch.ends):
+                    break
+                self.pending.popleft()
+
+            if chunks:
+                self._write(chunks[0] if len(chunks) == 1 else b''.join(chunks))
+                self._restart_ack_timer()
+
+        if not self.pending and not self.writing_paused:
+            self._wake(self.drain_waiters)
+
+    def _write(self, data):
+        if self.recorder is not None:
+            self.recorder.record(TRAFFIC.SERIAL_OUT, data)
+        self.transport.write(data)
+
+    def _acknowledge(self, event):
+        if self.resyncing:
+            _LOGGER.debug("Display return code %s answers a command given up on", event.type.name)
+            return
+
+        if not self.in_flight:
+            _LOGGER.debug("Display return code %s without a command in flight", event.type.name)
+            return
+
+        # In flight entries are [batch, next command to be answered, end of the written run]
+        entry = self.in_flight[0]
+        batch, index = entry[0], entry[1]
+        entry[1] += 1
+        if entry[1] == entry[2]:
+            self.in_flight.popleft()
+
+        size = batch.ends[index] - batch.start(index)
+        self.in_flight_count -= 1
+        self.in_flight_bytes -= size
+        self.acks += 1
+
+        overflow = event.type == DISPLAYINPUT.BUFFER_OVERFLOW and batch.attempts < ACK_RETRIES
+        if overflow and self.resend is None:
+            # Nothing more is written until every command after this one has been answered
+            self.resend = []
+
+        if event.type != DISPLAYINPUT.SUCCESS and not overflow:
+            self.errors += 1
+            _LOGGER.warning("Display rejected '%s': %s",
+                            batch.frame(index)[:-len(TERMINATOR)].decode(ENCODING, errors='replace'),
+                            event.type.name)
+        elif self.resend is not None:
+            self.resend.append((batch.frame(index), batch.attempts + 1, overflow))
+
+        self._restart_ack_timer()
+        if not self.in_flight:
+            if self.resend is not None:
+                self._queue_resend()
+            self._wake(self.ack_waiters)
+        self._flush()
+
+    def _queue_resend(self):
+        """Put the commands written since the overflow back in front of the queue, in order."""
+        resend, self.resend = self.resend, None
+
+        # A component written again later only needs its last value
+        written = set()
+        for batch in self.pending:
+            for index in range(batch.sent, len(batch.ends)):
+                written.add(self._component(batch.frame(index)))
+
+        frames = []
+        for frame, attempts, dropped in reversed(resend):
+            key = self._component(frame)
+            if key is not None and key in written:
+                continue
+            written.add(key)
+            frames.append((frame, attempts, dropped))
 
-async def main(event_loop):
-    transport, protocol = await serial_asyncio.create_serial_connection(event_loop,
-                                                                        DisplayController,
-                                                                        '/dev/ttyS1',
-                                                                        baudrate=115200,
-                                                                        timeout=0,
-                                                                        writeTimeout=0)
+        # Commands the display ran ahead of every remaining dropped one stay as they are
+        while frames and not frames[-1][2]:
+            frames.pop()
 
-    listener = MoonrakerController(event_loop)
-    await listener.connect()
+        for frame, attempts, _ in frames:
+            self.pending.appendleft(CommandBatch.command(frame, attempts))
+            self.pending_bytes += len(frame)
+
+        self.retries += len(frames)
+        if frames and self.retry_timer is None:
+            self.retry_timer = self.loop.call_later(ACK_RETRY_DELAY, self._retry)
+
+    @staticmethod
+    def _component(frame):
+        return ComponentCache.key(frame[:-len(TERMINATOR)].decode(ENCODING, errors='replace'))
+
+    def _retry(self):
+        self.retry_timer = None
+        self._flush()
+
+    def _restart_ack_timer(self):
+        if self.ack_timer is not None:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+
+        if self.in_flight or self.resyncing:
+            self.ack_timer = self.loop.call_later(ACK_TIMEOUT, self._ack_timeout)
+
+    def _ack_timeout(self):
+        self.ack_timer = None
+
+        if self.resyncing:
+            _LOGGER.warning("Display did not answer sendme after a timeout")
+            self.resyncing = False
+            self._flush()
+            return
 
-    navigation = NavigationController(loop, protocol, listener)
-    await navigation.startup()
+        _LOGGER.warning("Display did not answer %d commands", self.in_flight_count)
+        self.timeouts += self.in_flight_count
+        resend = self.resend
+        self._release_in_flight()
+
+        # Commands answered since an overflow are still sent again
+        if resend:
+            self.resend = resend
+            self._queue_resend()
+
+        # Codes still on their way would be taken for answers to the next commands,
+        # the page reply comes after all of them.
+        if self.transport is not None:
+            self.resyncing = True
+            self._write(encode_command('sendme'))
+            self._restart_ack_timer()
+
+    def _resynced(self):
+        self.resyncing = False
+        self._restart_ack_timer()
+        self._flush()
+
+    def _restarted(self):
+        # The display came back with its defaults, the commands in flight are lost
+        _LOGGER.warning("Display restarted, %d commands in flight are lost", self.in_flight_count)
+        self.acknowledged = False
+        self._release_in_flight()
+        self._flush()
+
+    def _release_in_flight(self):
+        for timer in (self.ack_timer, self.retry_timer):
+            if timer is not None:
+                timer.cancel()
+        self.ack_timer = self.retry_timer = None
+
+        self.in_flight.clear()
+        self.in_flight_count = 0
+        self.in_flight_bytes = 0
+        self.resend = None
+        self.resyncing = False
+        self._wake(self.ack_waiters)
+
+    @staticmethod
+    def _wake(waiters):
+        pending, waiters[:] = list(waiters), []
+        for waiter in pending:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+async def open_display(event_loop, protocol, device, display_state) -> int:
+    """Open and set up the display link, returns the baud rate it runs at."""
+    baudrate = display_state.load().get('baudrate', DEFAULT_BAUDRATE)
+
+    # The same protocol instance is reused so its queues survive a reconnect
+    await serial_asyncio.create_serial_connection(event_loop,
+                                                  lambda: protocol,
+                                                  device,
+                                                  baudrate=baudrate,
+                                                  timeout=0,
+                                                  writeTimeout=0)
+
+    await protocol.connected.wait()
+    negotiated = await protocol.negotiate_baudrate()
+    if negotiated != baudrate:
+        display_state.update(baudrate=negotiated)
+
+    await protocol.enable_acknowledgements()
+
+    if not protocol.connected.is_set():
+        raise DisplayLinkLost(f'{device} was lost while opening it')
+
+    return negotiated
+
+
+async def supervise_display(event_loop, protocol, navigation, device, display_state):
+    """Reopen the serial port whenever it is lost and redraw the display."""
+    while True:
+        await protocol.lost.wait()
+
+        attempt = 0
+        while not protocol.connected.is_set():
+            await asyncio.sleep(reconnect_delay(attempt))
+            attempt += 1
+
+            try:
+                baudrate = await open_display(event_loop, protocol, device, display_state)
+                navigation.scheduler.set_budget(serial_budget(baudrate))
+            except OSError as e:
+                _LOGGER.warning("Could not reopen %s: %s", device, repr(e))
+
+        _LOGGER.info("Display link reopened")
+        await navigation.redraw()
+
+
+@contextlib.asynccontextmanager
+async def monitoring(event_loop, metrics_host=METRICS_HOST, metrics_port=METRICS_PORT):
+    """Loop monitor, metrics endpoint and profiler, once per process however many printers it drives."""
+    # Watches the loop from the start, the serial probes are when it is most likely to block
+    metrics = Metrics()
+    monitor = LoopMonitor(metrics)
+    monitor_task = event_loop.create_task(monitor.run())
+    server = MetricsServer({'/metrics': metrics.render, '/stalls': monitor.report})
+
+    profiler = Profiler(event_loop)
+    event_loop.add_signal_handler(PROFILE_SIGNAL, profiler.toggle)
+
+    try:
+        if metrics_port is not None:
+            try:
+                await server.start(metrics_host, metrics_port)
+            except OSError as e:
+                _LOGGER.error("Could not serve metrics on %s:%s: %s", metrics_host, metrics_port, repr(e))
+
+        yield metrics
+    finally:
+        event_loop.remove_signal_handler(PROFILE_SIGNAL)
+        profiler.stop()
+        monitor_task.cancel()
+        await server.close()
+
+
+async def run_printer(event_loop, metrics, device=DISPLAY_DEVICE, host=MOONRAKER_HOST, port=MOONRAKER_PORT,
+                      state_file=DISPLAY_STATE_FILE, snapshot_file=SNAPSHOT_FILE, capture_file=CAPTURE_FILE,
+                      thumbnailer=None):
+    """Drive one display from one Moonraker instance until cancelled."""
+    started = time.monotonic()
+    display_state = JsonStore(state_file)
+    recorder = TrafficRecorder(capture_file) if capture_file else None
+    protocol = DisplayController()
+    protocol.recorder = recorder
+    navigation = None
+    tasks = []
+
+    try:
+        baudrate = await open_display(event_loop, protocol, device, display_state)
+
+        listener = MoonrakerController(event_loop, host, port, metrics=metrics, recorder=recorder)
+        navigation = NavigationController(event_loop, protocol, listener, budget=serial_budget(baudrate),
+                                          snapshot_file=snapshot_file, started=started, metrics=metrics, thumbnailer=thumbnailer)
+        await navigation.show_splash()
+
+        tasks = [event_loop.create_task(listener.run()),
+                 event_loop.create_task(supervise_display(event_loop, protocol, navigation, device, display_state)),
+                 event_loop.create_task(navigation.startup())]
+        await asyncio.gather(*tasks)
+    finally:
+        # Nothing of a failed printer may keep running when it is started again
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if navigation is not None:
+            await navigation.close()
+
+        if protocol.transport is not None:
+            protocol.transport.close()
+        if recorder is not None:
+            recorder.close()
+
+
+async def main(event_loop, device=DISPLAY_DEVICE, host=MOONRAKER_HOST, port=MOONRAKER_PORT,
+               state_file=DISPLAY_STATE_FILE, snapshot_file=SNAPSHOT_FILE, metrics_host=METRICS_HOST,
+               metrics_port=METRICS_PORT, capture_file=CAPTURE_FILE):
+    async with monitoring(event_loop, metrics_host, metrics_port) as metrics:
+        await run_printer(event_loop, metrics, device, host, port, state_file, snapshot_file, capture_file)
 
 
 if __name__ == "__main__":
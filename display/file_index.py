@@ -0,0 +1,247 @@
+import bisect
+import logging
+import posixpath
+
+_LOGGER = logging.getLogger(__name__)
+
+SORT_KEYS = {
+    'name': lambda entry: entry['name'].lower(),
+    'modified': lambda entry: entry.get('modified') or 0,
+    'size': lambda entry: entry.get('size') or 0,
+}
+
+# Directories that are mounted into the gcodes root and may change without
+# Moonraker noticing, they are re-listed every time they are opened.
+UNWATCHED_DIRECTORIES = ('USB',)
+
+
+class Directory:
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.directories = set()
+        self.sorted_files = {}
+        self.sorted_directories = None
+
+    def add_file(self, entry):
+        self.remove_file(entry['name'])
+        self.files[entry['name']] = entry
+
+        for sort_by, sorted_files in self.sorted_files.items():
+            bisect.insort(sorted_files, (SORT_KEYS[sort_by](entry), entry['name']))
+
+    def remove_file(self, name):
+        entry = self.files.pop(name, None)
+        if entry is None:
+            return None
+
+        for sort_by, sorted_files in self.sorted_files.items():
+            item = (SORT_KEYS[sort_by](entry), name)
+            del sorted_files[bisect.bisect_left(sorted_files, item)]
+
+        return entry
+
+    def add_directory(self, name):
+        if name not in self.directories:
+            self.directories.add(name)
+            self.sorted_directories = None
+
+    def remove_directory(self, name):
+        if name in self.directories:
+            self.directories.discard(name)
+            self.sorted_directories = None
+
+    def get_directories(self):
+        if self.sorted_directories is None:
+            self.sorted_directories = sorted(self.directories, key=str.lower)
+
+        return self.sorted_directories
+
+    def get_files(self, sort_by):
+        # Each sort order is built once and kept current by add and remove
+        if sort_by not in self.sorted_files:
+            key = SORT_KEYS[sort_by]
+            self.sorted_files[sort_by] = sorted((key(entry), name) for name, entry in self.files.items())
+
+        return self.sorted_files[sort_by]
+
+
+class FileIndex:
+    """In-memory index of a Moonraker file root.
+
+    Loaded with server.files.list and then kept current from
+    notify_filelist_changed notifications. Changes made while the websocket
+    was down are never notified, so every reconnect marks it for reloading.
+    """
+
+    def __init__(self, moonraker, root='gcodes'):
+        self.moonraker = moonraker
+        self.root = root
+        self.directories = {'': Directory('')}
+        self.loaded = False
+
+        moonraker.add_notification_handler('notify_filelist_changed', self.on_filelist_changed)
+        moonraker.add_connect_handler(self.invalidate)
+
+    async def load(self):
+        files = await self.moonraker.call_method('server.files.list', root=self.root)
+        self.restore(files)
+        _LOGGER.debug("Indexed %s files in %s", len(files), self.root)
+
+    def snapshot(self) -> list:
+        """Files in the server.files.list format, for restoring at the next start."""
+        return [{'path': entry['filename'], 'modified': entry['modified'], 'size': entry['size'],
+                 'permissions': entry['permissions']}
+                for directory in self.directories.values() for entry in directory.files.values()]
+
+    def restore(self, files):
+        self.directories = {'': Directory('')}
+        for file_data in files:
+            self._add_file(file_data)
+
+        self.loaded = True
+
+    def invalidate(self):
+        """Reload on the next use, the listing stays usable until then."""
+        self.loaded = False
+
+    async def refresh_directory(self, path):
+        response = await self.moonraker.call_method('server.files.get_directory',
+                                                    path=posixpath.join(self.root, path), extended=False)
+
+        self._remove_directory(path)
+        self._get_directory(path)
+
+        for directory_data in response.get('dirs', []):
+            self._get_directory(posixpath.join(path, directory_data['dirname']))
+
+        for file_data in response.get('files', []):
+            self._add_file(dict(file_data, path=posixpath.join(path, file_data['filename'])))
+
+    def count(self, path=''):
+        directory = self.directories.get(path)
+        if directory is None:
+            return 0
+
+        return len(directory.directories) + len(directory.files)
+
+    def listing(self, path='', offset=0, limit=None, sort_by='name', reverse=False):
+        """List the sub directories and then the files of a directory.
+
+        Only the requested slice is materialized.
+        """
+        directory = self.directories.get(path)
+        if directory is None:
+            return []
+
+        if limit is None:
+            limit = self.count(path)
+
+        entries = []
+        directories = directory.get_directories()
+        for name in directories[offset:offset + limit]:
+            entries.append({'name': name, 'filename': posixpath.join(path, name), 'type': 'directory'})
+
+        offset = max(offset - len(directories), 0)
+        limit -= len(entries)
+        if limit <= 0:
+            return entries
+
+        files = directory.get_files(sort_by)
+        if reverse:
+            end = len(files) - offset
+            selection = reversed(files[max(end - limit, 0):max(end, 0)])
+        else:
+            selection = files[offset:offset + limit]
+
+        for _, name in selection:
+            entries.append(directory.files[name])
+
+        return entries
+
+    def on_filelist_changed(self, data):
+        for change in data:
+            item = change.get('item', {})
+            if item.get('root') != self.root:
+                continue
+
+            action = change['action']
+            path = item['path']
+
+            if action in ('create_file', 'modify_file'):
+                self._add_file(item)
+            elif action == 'delete_file':
+                self._remove_file(path)
+            elif action == 'move_file':
+                self._remove_file(change['source_item']['path'])
+                self._add_file(item)
+            elif action == 'create_dir':
+                self._get_directory(path)
+            elif action == 'delete_dir':
+                self._remove_directory(path)
+            elif action == 'move_dir':
+                self._move_directory(change['source_item']['path'], path)
+            elif action == 'root_update':
+                self.loaded = False
+
+    def _get_directory(self, path):
+        directory = self.directories.get(path)
+
+        if directory is None:
+            directory = Directory(path)
+            self.directories[path] = directory
+
+            if path:
+                parent, name = posixpath.split(path)
+                self._get_directory(parent).add_directory(name)
+
+        return directory
+
+    def _add_file(self, file_data):
+        parent, name = posixpath.split(file_data['path'])
+
+        entry = {
+            'name': name,
+            'filename': file_data['path'],
+            'type': 'file',
+            'modified': file_data.get('modified'),
+            'size': file_data.get('size'),
+            'permissions': file_data.get('permissions'),
+        }
+        self._get_directory(parent).add_file(entry)
+
+    def _remove_file(self, path):
+        parent, name = posixpath.split(path)
+        directory = self.directories.get(parent)
+
+        if directory is not None:
+            return directory.remove_file(name)
+
+    def _remove_directory(self, path):
+        if not path:
+            self.directories = {'': Directory('')}
+            return
+
+        prefix = path + '/'
+        for directory_path in [p for p in self.directories if p.startswith(prefix)]:
+            del self.directories[directory_path]
+
+        self.directories.pop(path, None)
+        parent, name = posixpath.split(path)
+        if parent in self.directories:
+            self.directories[parent].remove_directory(name)
+
+    def _move_directory(self, source, destination):
+        prefix = source + '/'
+        moved = [directory for path, directory in self.directories.items()
+                 if path == source or path.startswith(prefix)]
+
+        self._remove_directory(source)
+        self._get_directory(destination)
+
+        for directory in moved:
+            path = destination + directory.path[len(source):]
+            self._get_directory(path)
+
+            for entry in directory.files.values():
+                self._add_file(dict(entry, path=posixpath.join(path, entry['name'])))
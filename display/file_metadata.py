@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of server.files.metadata requests allowed in flight at once
+METADATA_CONCURRENCY = 4
+
+# Number of metadata entries kept in memory
+METADATA_CACHE_SIZE = 512
+
+
+class MetadataCache:
+    """Least recently used metadata cache keyed by file path and modified time."""
+
+    def __init__(self, maxsize=METADATA_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, path, modified):
+        key = (path, modified)
+        metadata = self.entries.get(key)
+
+        if metadata is not None:
+            self.entries.move_to_end(key)
+
+        return metadata
+
+    def put(self, path, modified, metadata):
+        key = (path, modified)
+        self.entries[key] = metadata
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class MetadataFetcher:
+    """Fetches gcode metadata from Moonraker with bounded concurrency.
+
+    Concurrent requests for the same file share one RPC.
+    """
+
+    def __init__(self, moonraker, concurrency=METADATA_CONCURRENCY, cache=None):
+        self.moonraker = moonraker
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = cache if cache is not None else MetadataCache()
+        self.in_flight = {}
+
+    def cached(self, path, modified=None):
+        return self.cache.get(path, modified)
+
+    async def fetch(self, path, modified=None):
+        metadata = self.cache.get(path, modified)
+        if metadata is not None:
+            return metadata
+
+        key = (path, modified)
+        if key not in self.in_flight:
+            self.in_flight[key] = asyncio.ensure_future(self._fetch(path, modified))
+
+        return await asyncio.shield(self.in_flight[key])
+
+    async def fetch_many(self, files):
+        return await asyncio.gather(*[self.fetch(file_data['filename'], file_data.get('modified'))
+                                      for file_data in files])
+
+    async def _fetch(self, path, modified):
+        try:
+            async with self.semaphore:
+                metadata = await self.moonraker.call_method('server.files.metadata', filename=path)
+
+            # Errors are asked for again the next time the file is shown
+            if isinstance(metadata, dict) and 'error' in metadata:
+                _LOGGER.warning("No metadata for %s: %s", path, metadata['error'])
+            else:
+                self.cache.put(path, modified, metadata)
+            return metadata
+        finally:
+            del self.in_flight[(path, modified)]
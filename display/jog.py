@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import logging
+
+from metrics import HANDLER_STARTED
+from refresh_scheduler import JOG_POSITION_RATE
+
+_LOGGER = logging.getLogger(__name__)
+
+AXES = ('x', 'y', 'z')
+
+# Furthest the queued jog target may run ahead of the moves already sent, in mm
+MAX_JOG_LEAD = 50
+
+
+class JogAccumulator:
+    """Sums relative jogs per axis while a move is in flight.
+
+    The first jog is sent straight away, everything pressed while it runs is
+    combined into a single move sent when it completes.
+    """
+
+    def __init__(self, navigation, max_lead=MAX_JOG_LEAD):
+        self.navigation = navigation
+        self.max_lead = max_lead
+        self.pending = dict.fromkeys(AXES, 0.0)
+        self.in_flight = dict.fromkeys(AXES, 0.0)
+        self.target = None
+        self.task = None
+
+    @property
+    def active(self):
+        return self.target is not None
+
+    def add(self, axis, distance, position):
+        """Queue a relative move, `position` is the last known toolhead position."""
+        if self.target is None:
+            self.target = dict(zip(AXES, position[:3]))
+            self.navigation.scheduler.set_rate('position', JOG_POSITION_RATE)
+
+        lead = self.pending[axis] + self.in_flight[axis]
+        distance = max(-self.max_lead - lead, min(self.max_lead - lead, distance))
+        if not distance:
+            return
+
+        self.pending[axis] += distance
+        self.target[axis] += distance
+
+        if self.task is None or self.task.done():
+            self.task = self.navigation.loop.create_task(self._run())
+
+    def predicted_position(self, position):
+        if self.target is None:
+            return position
+
+        return [self.target['x'], self.target['y'], self.target['z']] + list(position[3:])
+
+    async def _run(self):
+        try:
+            async with self.navigation.motion_lock:
+                while any(self.pending.values()):
+                    self.in_flight, self.pending = self.pending, dict.fromkeys(AXES, 0.0)
+                    move = ' '.join(f'{axis.upper()}{distance:g}' for axis, distance in self.in_flight.items()
+                                    if distance)
+
+                    try:
+                        await self.navigation.send_gcode('G91', f'G1 {move}', 'G90')
+                    except Exception:
+                        # Klipper stops the script at the failed move, G90 did not run
+                        with contextlib.suppress(Exception):
+                            await self.navigation.send_gcode('G90')
+                        raise
+                    self.in_flight = dict.fromkeys(AXES, 0.0)
+
+                    # Moves combined from later jogs were not started by the handler of the first
+                    HANDLER_STARTED.set(None)
+        except asyncio.CancelledError:
+            await self.navigation.show_cancelled('jog')
+            raise
+        except Exception as e:
+            _LOGGER.error("Jog failed: %s", repr(e))
+            await self.navigation.show_error(str(e))
+        finally:
+            self.pending = dict.fromkeys(AXES, 0.0)
+            self.in_flight = dict.fromkeys(AXES, 0.0)
+            self.target = None
+            self.navigation.scheduler.set_rate('position')
+            self.navigation.request_render()
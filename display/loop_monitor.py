@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds between event loop heartbeats
+HEARTBEAT_INTERVAL = 0.05
+
+# A heartbeat this many seconds late is a stall, reported with the blocking stack
+STALL_THRESHOLD = 0.1
+
+# Stalls kept for the metrics endpoint
+STALL_HISTORY = 20
+
+
+class LoopMonitor:
+    """Measures event loop lag and catches what blocks it.
+
+    A heartbeat task records how late every wakeup is. A watchdog thread
+    notices a heartbeat overdue by STALL_THRESHOLD while the loop is still
+    blocked and saves the loop thread's stack, so the stall is reported
+    with the code that caused it instead of whatever ran afterwards.
+    """
+
+    def __init__(self, metrics, interval=HEARTBEAT_INTERVAL, threshold=STALL_THRESHOLD):
+        self.metrics = metrics
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = metrics.histogram('display_loop_lag_seconds', 'Event loop wakeup delay per heartbeat')
+        self.lock = threading.Lock()
+        self.loop_thread = None
+        self.beat = time.monotonic()
+        self.stack = None
+        self.stalls = deque(maxlen=STALL_HISTORY)
+        self.stopped = threading.Event()
+
+    async def run(self):
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.stopped.clear()
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+
+                now = time.monotonic()
+                with self.lock:
+                    self.beat = now
+                    stack, self.stack = self.stack, None
+
+                lag = max(now - expected, 0)
+                self.lag.observe(lag)
+                if lag >= self.threshold:
+                    self._report(lag, stack)
+        finally:
+            self.stopped.set()
+
+    def report(self) -> str:
+        """Recent stalls with their stacks, newest first."""
+        return '\n'.join(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when))} '
+                         f'stalled {lag * 1000:.0f} ms\n{stack}'
+                         for when, lag, stack in reversed(self.stalls))
+
+    def _report(self, lag, stack):
+        stack = stack or 'Stack not captured\n'
+        self.stalls.append((time.time(), lag, stack))
+        self.metrics.increment('display_loop_stalls_total', f'Event loop stalls over {self.threshold} s')
+        _LOGGER.warning("Event loop stalled for %.0f ms in:\n%s", lag * 1000, stack.rstrip())
+
+    def _watch(self):
+        while not self.stopped.wait(self.threshold / 2):
+            with self.lock:
+                if self.stack is not None or time.monotonic() - self.beat < self.interval + self.threshold:
+                    continue
+
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None:
+                    self.stack = ''.join(traceback.format_stack(frame))
+                    del frame
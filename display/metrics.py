@@ -0,0 +1,192 @@
+from __future__ import annotations
+import asyncio
+import bisect
+import copy
+import logging
+from contextvars import ContextVar
+
+_LOGGER = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Largest request the metrics endpoint reads
+MAX_REQUEST_SIZE = 4096
+
+# Seconds a scraper gets to send its request
+REQUEST_TIMEOUT = 5
+
+# Loop time the display event handler of the current task started
+HANDLER_STARTED = ContextVar('handler_started', default=None)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, cheap enough for every event."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q) -> float | None:
+        """Upper bound of the bucket holding the `q` quantile, None when empty."""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Histograms, counters and stats callbacks in the Prometheus text format.
+
+    Histograms and counters are keyed by name and label values. Collectors
+    are the `stats()` methods the controllers already have, read when the
+    metrics are scraped. `scoped()` shares the registry with labels added to
+    every series, e.g. one scope per printer.
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self.help = {}
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = {}
+
+    def scoped(self, **labels) -> Metrics:
+        scoped = copy.copy(self)
+        scoped.labels = {**self.labels, **labels}
+        return scoped
+
+    def histogram(self, name, description, bounds=LATENCY_BUCKETS, **labels) -> Histogram:
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            self.help.setdefault(name, description)
+            histogram = self.histograms[key] = Histogram(bounds)
+        return histogram
+
+    def increment(self, name, description, amount=1, **labels):
+        key = self._key(name, labels)
+        self.help.setdefault(name, description)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_collector(self, prefix, stats):
+        """Expose every value of `stats()` as the gauge `<prefix>_<key>`."""
+        self.collectors[self._key(prefix, {})] = stats
+
+    def _key(self, name, labels) -> tuple:
+        return name, tuple(sorted({**self.labels, **labels}.items()))
+
+    def render(self) -> str:
+        lines = []
+
+        for name, series in _by_name(self.counters):
+            lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} counter')
+            for labels, value in series:
+                lines.append(f'{name}{_labels(labels)} {value}')
+
+        for name, series in _by_name(self.histograms):
+            lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+                lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+        gauges = {}
+        for (prefix, labels), stats in self.collectors.items():
+            try:
+                values = stats()
+            except Exception as e:
+                _LOGGER.error("Could not collect %s metrics: %s", prefix, repr(e))
+                continue
+
+            for key, value in values.items():
+                gauges[(f'{prefix}_{key}', labels)] = value
+
+        for name, series in _by_name(gauges):
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in series:
+                lines.append(f'{name}{_labels(labels)} {value}')
+
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _by_name(series):
+    names = {}
+    for (name, labels), value in series.items():
+        names.setdefault(name, []).append((labels, value))
+    return names.items()
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint serving plain text pages, e.g. `/metrics`.
+
+    Only GET is answered and every connection is closed after one response,
+    which is all a Prometheus scraper or curl needs.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._handle, host, port, limit=MAX_REQUEST_SIZE)
+        _LOGGER.info("Serving metrics on %s:%s", host, port)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT)
+            method, path, _ = request.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+
+            page = self.pages.get(path.split('?', 1)[0])
+            if method != 'GET':
+                status, body = '405 Method Not Allowed', ''
+            elif page is None:
+                status, body = '404 Not Found', ''
+            else:
+                status, body = '200 OK', page()
+
+            data = body.encode('utf-8')
+            writer.write(f'HTTP/1.0 {status}\r\n'
+                         f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except ConnectionError as e:
+            _LOGGER.debug("Metrics request failed: %s", repr(e))
+        finally:
+            writer.close()
@@ -0,0 +1,312 @@
+from __future__ import annotations
+import logging
+from typing import Any, NamedTuple
+
+from response_actions2 import DISPLAYINPUT
+
+_LOGGER = logging.getLogger(__name__)
+
+TERMINATOR = b'\xff\xff\xff'
+
+# Text encoding of the display fonts, `°` goes out as 0xC2 0xB0
+ENCODING = 'utf-8'
+
+# Initial size of the reusable command output buffer
+OUTPUT_BUFFER_SIZE = 1024
+
+# Values below this are rendered from pre-encoded digits
+CACHED_INTEGERS = 1024
+
+# Payload length per return code, codes not listed here carry no payload.
+# Frames are cut at this length so a value containing 0xFF is not cut short.
+PAYLOAD_LENGTH = {
+    DISPLAYINPUT.BUTTON.value: 3,
+    DISPLAYINPUT.PAGE.value: 1,
+    DISPLAYINPUT.TOUCH.value: 5,
+    DISPLAYINPUT.TOUCH_SLEEP.value: 5,
+    DISPLAYINPUT.TEXT.value: 4,
+}
+
+# The Elegoo HMI prefixes numeric values with page and component id
+PREFIXED_NUMERIC_LENGTH = 6
+
+# 0x00 0x00 0x00 is sent once when the display starts, a lone 0x00 is a bkcmd reply
+STARTUP_PAYLOAD = b'\x00\x00'
+
+RETURN_CODES = {member.value: member for member in DISPLAYINPUT}
+
+# bkcmd replies, one per instruction, all below the touch and data events
+INSTRUCTION_RESULTS = frozenset(member for member in DISPLAYINPUT
+                                if member.value <= DISPLAYINPUT.BUFFER_OVERFLOW.value)
+
+
+_INTEGER_BYTES = tuple(str(number).encode(ENCODING) for number in range(CACHED_INTEGERS))
+
+
+def encode_command(command) -> bytes:
+    return command.encode(ENCODING) + TERMINATOR
+
+
+def encode_value(value) -> bytes:
+    if type(value) is int and 0 <= value < CACHED_INTEGERS:
+        return _INTEGER_BYTES[value]
+
+    return str(value).encode(ENCODING)
+
+
+class CommandTemplate:
+    """Command with a single `{}` value slot, encoded once around it.
+
+    Only the value is encoded when rendering, the text before and after it
+    and the terminator are cached as bytes.
+    """
+
+    __slots__ = ('template', 'prefix', 'suffix')
+
+    def __init__(self, template):
+        before, slot, after = template.partition('{}')
+        if not slot or '{}' in after:
+            raise ValueError(f'Command template needs exactly one {{}} slot: {template!r}')
+
+        self.template = template
+        self.prefix = before.encode(ENCODING)
+        self.suffix = after.encode(ENCODING) + TERMINATOR
+
+    def __repr__(self):
+        return f'CommandTemplate({self.template!r})'
+
+    def format(self, value) -> str:
+        return self.template.format(value)
+
+    def render(self, buffer, value) -> int:
+        """Write the command for `value` into `buffer` and return its size."""
+        return buffer.write(self.prefix, encode_value(value), self.suffix)
+
+
+class CommandBuffer:
+    """Reusable output buffer that commands are rendered into.
+
+    The bytearray is written through a memoryview and only ever grown,
+    `length` marks the part in use, so a batch of commands is rendered
+    without allocating. `ends` holds the end offset of every command.
+    """
+
+    def __init__(self, size=OUTPUT_BUFFER_SIZE):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.length = 0
+        self.ends = []
+
+    def write(self, prefix, value, suffix) -> int:
+        start = self.length
+        value_start = start + len(prefix)
+        suffix_start = value_start + len(value)
+        end = suffix_start + len(suffix)
+        if end > len(self.data):
+            self._grow(end)
+
+        view = self.view
+        view[start:value_start] = prefix
+        view[value_start:suffix_start] = value
+        view[suffix_start:end] = suffix
+
+        self.length = end
+        self.ends.append(end)
+        return end - start
+
+    def take(self) -> CommandBatch | None:
+        """Return what was rendered as a batch and empty the buffer for reuse.
+
+        The transport holds on to what it is given until it is written, so
+        the rendered bytes are copied out once, the batch then owns them.
+        """
+        if not self.ends:
+            return None
+
+        batch = CommandBatch(bytes(self.view[:self.length]), self.ends)
+        self.length = 0
+        self.ends = []
+        return batch
+
+    def _grow(self, size):
+        # A bytearray cannot be resized while a memoryview of it exists
+        self.view.release()
+        self.data.extend(bytes(max(size, 2 * len(self.data)) - len(self.data)))
+        self.view = memoryview(self.data)
+
+
+class CommandBatch:
+    """Commands that go to the transport as one bytes object.
+
+    `ends` holds the end offset of every command and `sent` counts those
+    already written, a batch cut short by the acknowledgement window is
+    written in parts. Queries answered with data instead of a return code
+    are not `acknowledged`.
+    """
+
+    __slots__ = ('data', 'ends', 'sent', 'attempts', 'acknowledged')
+
+    def __init__(self, data, ends, attempts=0, acknowledged=True):
+        self.data = data
+        self.ends = ends
+        self.sent = 0
+        self.attempts = attempts
+        self.acknowledged = acknowledged
+
+    @classmethod
+    def command(cls, frame, attempts=0, acknowledged=True) -> CommandBatch:
+        return cls(frame, [len(frame)], attempts, acknowledged)
+
+    def start(self, index) -> int:
+        return self.ends[index - 1] if index else 0
+
+    def frame(self, index) -> bytes:
+        return self.data[self.start(index):self.ends[index]]
+
+
+class DisplayEvent(NamedTuple):
+    type: DISPLAYINPUT
+    page: int | None = None
+    action: int | None = None
+    value: Any = None
+    payload: bytes = b''
+    # Loop time the frame arrived, set for events queued for the handlers
+    received: float | None = None
+
+
+class NextionFrameParser:
+    """Incremental parser for frames sent by the Nextion display.
+
+    Chunks from the serial transport are appended to a rolling buffer and
+    cut into frames by the payload length of their return code, so frames
+    spread over several chunks or several frames in one chunk come out
+    whole and in order, even when a value contains 0xFF.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # get commands not answered yet, their numeric reply is a bare 4 byte value
+        self.queries = 0
+
+    def reset(self):
+        """Forget a partial frame and the open queries, e.g. after the link was reopened."""
+        self.buffer.clear()
+        self.queries = 0
+
+    def feed(self, data) -> list[DisplayEvent]:
+        self.buffer += data
+
+        buffer = self.buffer
+        events = []
+        start = 0
+
+        while start < len(buffer):
+            code = buffer[start]
+
+            # A frame never starts with 0xFF, these are left from a broken frame
+            if code == 0xFF:
+                start += 1
+                continue
+
+            end = self._frame_end(code, start)
+            if end == -1:
+                break
+
+            if end is None:
+                # Drop a cut short frame up to its terminator
+                end = buffer.find(TERMINATOR, start + 1)
+                if end == -1:
+                    break
+
+                _LOGGER.error('Malformed display frame 0x%02x %s', code, buffer[start + 1:end].hex())
+                start = end + 3
+                continue
+
+            event = self._parse(code, bytes(buffer[start + 1:end]))
+            start = end + 3
+
+            if event:
+                events.append(event)
+
+        if start:
+            del buffer[:start]
+
+        return events
+
+    def _frame_end(self, code, start) -> int | None:
+        """Index of the terminator of the frame at `start`.
+
+        -1 while the frame is not complete, None when the buffer does not
+        hold a valid frame at `start`.
+        """
+        buffer = self.buffer
+
+        if code == DISPLAYINPUT.STRING.value or code not in RETURN_CODES:
+            return buffer.find(TERMINATOR, start + 1)
+
+        if code == DISPLAYINPUT.INVALID_INSTRUCTION.value:
+            if len(buffer) < start + 2:
+                return -1
+            if buffer[start + 1] == 0:
+                return self._fixed_end(start, len(STARTUP_PAYLOAD))
+
+        if code == DISPLAYINPUT.TEXT.value:
+            prefixed = self._fixed_end(start, PREFIXED_NUMERIC_LENGTH)
+            if prefixed is not None and prefixed != -1:
+                return prefixed
+
+            end = self._fixed_end(start, PAYLOAD_LENGTH[code])
+            if end is None or end == -1 or prefixed is None:
+                return prefixed if end is None else end
+
+            # A 4 byte frame could still be a prefixed value ending in 0xFF 0xFF
+            # followed by its terminator. It is the reply to an open query,
+            # otherwise wait until the next bytes tell.
+            if self.queries or buffer[end + 3:].strip(b'\xff'):
+                return end
+            return -1
+
+        return self._fixed_end(start, PAYLOAD_LENGTH.get(code, 0))
+
+    def _fixed_end(self, start, length) -> int | None:
+        end = start + 1 + length
+        if len(self.buffer) < end + 3:
+            return -1
+        return end if self.buffer[end:end + 3] == TERMINATOR else None
+
+    def _parse(self, code, payload) -> DisplayEvent | None:
+        event_type = RETURN_CODES.get(code)
+
+        if event_type is None:
+            _LOGGER.error('Unknown display return code 0x%02x %s', code, payload.hex())
+            return None
+
+        if event_type == DISPLAYINPUT.BUTTON:
+            return DisplayEvent(event_type, payload[0], payload[1],
+                                payload[2] if len(payload) > 2 else None, payload)
+
+        if event_type == DISPLAYINPUT.TEXT:
+            # Standard numeric frame is a bare 4 byte little endian value,
+            # the Elegoo HMI prefixes it with page and component id.
+            if len(payload) == 4:
+                self.queries = max(self.queries - 1, 0)
+                return DisplayEvent(event_type, None, None,
+                                    int.from_bytes(payload, 'little', signed=True), payload)
+
+            value = payload[2:6]
+            return DisplayEvent(event_type, payload[0], payload[1],
+                                int.from_bytes(value, 'little', signed=len(value) == 4), payload)
+
+        if event_type == DISPLAYINPUT.PAGE:
+            return DisplayEvent(event_type, payload[0], payload=payload)
+
+        if event_type in (DISPLAYINPUT.TOUCH, DISPLAYINPUT.TOUCH_SLEEP):
+            x = int.from_bytes(payload[0:2], 'big')
+            y = int.from_bytes(payload[2:4], 'big')
+            return DisplayEvent(event_type, action=payload[4], value=(x, y), payload=payload)
+
+        if event_type == DISPLAYINPUT.STRING:
+            self.queries = max(self.queries - 1, 0)
+            return DisplayEvent(event_type, value=payload.decode('latin-1'), payload=payload)
+
+        return DisplayEvent(event_type, payload=payload)
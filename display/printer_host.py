@@ -0,0 +1,176 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import configparser
+import logging
+import os
+from contextvars import ContextVar
+from typing import NamedTuple
+
+import displayasync
+from storage import STATE_DIR
+from thumbnails import Thumbnailer
+
+_LOGGER = logging.getLogger(__name__)
+
+CONFIG_FILE = os.path.expanduser('~/printer_data/config/display_printers.cfg')
+
+# Sections named `[printer <name>]` each configure one display and Moonraker pair
+PRINTER_SECTION = 'printer '
+HOST_SECTION = 'host'
+
+# Name of the printer the current task works for, added to every log record
+PRINTER_NAME = ContextVar('printer_name', default='-')
+
+
+class HostConfigError(Exception):
+    pass
+
+
+class PrinterConfig(NamedTuple):
+    name: str
+    device: str
+    host: str
+    port: int
+    state_dir: str
+    capture_file: str | None = None
+
+
+class PrinterLogFilter(logging.Filter):
+    def filter(self, record):
+        record.printer = PRINTER_NAME.get()
+        return True
+
+
+def load_config(path) -> tuple[dict, list[PrinterConfig]]:
+    """Read the printers and the host options from an ini file.
+
+        [host]
+        metrics_host = 127.0.0.1
+        metrics_port = 9105
+
+        [printer n4-01]
+        device = /dev/ttyUSB0
+        host = 192.168.1.21
+        port = 7125
+
+    `state_dir` defaults to a directory per printer under STATE_DIR and
+    `capture_file` records the printer's traffic. Raises HostConfigError
+    listing every bad entry.
+    """
+    parser = configparser.ConfigParser()
+    try:
+        if not parser.read(path):
+            raise HostConfigError(f'Could not read {path}')
+    except configparser.Error as e:
+        raise HostConfigError(f'Invalid {path}: {e}') from None
+
+    errors = []
+    printers = []
+    devices = {}
+
+    for section in parser.sections():
+        if section == HOST_SECTION:
+            continue
+
+        if not section.startswith(PRINTER_SECTION):
+            errors.append(f'[{section}]: unknown section')
+            continue
+
+        name = section[len(PRINTER_SECTION):].strip()
+        options = parser[section]
+        if not name or os.sep in name:
+            errors.append(f'[{section}]: not a printer name')
+            continue
+
+        device = options.get('device')
+        if not device:
+            errors.append(f'[{section}]: no device')
+            continue
+        if device in devices:
+            errors.append(f'[{section}]: {device} is already used by {devices[device]}')
+            continue
+        devices[device] = name
+
+        try:
+            port = options.getint('port', displayasync.MOONRAKER_PORT)
+        except ValueError:
+            errors.append(f'[{section}]: port {options["port"]!r} is not a number')
+            continue
+
+        printers.append(PrinterConfig(name, device, options.get('host', displayasync.MOONRAKER_HOST), port,
+                                      options.get('state_dir', os.path.join(STATE_DIR, name)),
+                                      options.get('capture_file')))
+
+    host = parser[HOST_SECTION] if parser.has_section(HOST_SECTION) else {}
+    metrics_port = host.get('metrics_port', str(displayasync.METRICS_PORT))
+    if metrics_port.lower() == 'off':
+        metrics_port = None
+    elif not metrics_port.isdigit():
+        errors.append(f'[{HOST_SECTION}]: metrics_port {metrics_port!r} is not a number or off')
+    else:
+        metrics_port = int(metrics_port)
+
+    if not printers and not errors:
+        errors.append(f'no [{PRINTER_SECTION}<name>] sections')
+
+    if errors:
+        raise HostConfigError(f'Invalid {path}:\n  ' + '\n  '.join(errors))
+
+    options = {
+        'metrics_host': host.get('metrics_host', displayasync.METRICS_HOST),
+        'metrics_port': metrics_port,
+    }
+    return options, printers
+
+
+async def supervise_printer(event_loop, printer, metrics, thumbnailer):
+    """Keep one printer running, restarting it alone when it fails."""
+    PRINTER_NAME.set(printer.name)
+    metrics = metrics.scoped(printer=printer.name)
+
+    attempt = 0
+    while True:
+        try:
+            await displayasync.run_printer(event_loop, metrics, printer.device, printer.host, printer.port,
+                                           os.path.join(printer.state_dir, 'display.json'),
+                                           os.path.join(printer.state_dir, 'snapshot.json'),
+                                           printer.capture_file, thumbnailer)
+        except OSError as e:
+            _LOGGER.warning("Could not open %s: %s", printer.device, repr(e))
+        except Exception:
+            _LOGGER.exception("Printer stopped")
+
+        await asyncio.sleep(displayasync.reconnect_delay(attempt))
+        attempt += 1
+
+
+async def main(event_loop, config_file=CONFIG_FILE):
+    options, printers = load_config(config_file)
+
+    # One thumbnail cache and worker pool for all printers
+    thumbnailer = Thumbnailer(event_loop)
+
+    async with displayasync.monitoring(event_loop, **options) as metrics:
+        _LOGGER.info("Driving %d printers", len(printers))
+        try:
+            await asyncio.gather(*[supervise_printer(event_loop, printer, metrics, thumbnailer)
+                                   for printer in printers])
+        finally:
+            if thumbnailer.executor is not None:
+                thumbnailer.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Drive several displays, each from its own Moonraker.')
+    parser.add_argument('config', nargs='?', default=CONFIG_FILE, help=f'printer config (default: {CONFIG_FILE})')
+    args = parser.parse_args()
+
+    logging.getLogger(__name__).setLevel(logging.INFO)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(PrinterLogFilter())
+        handler.setFormatter(logging.Formatter("%(printer)s %(name)s - %(levelname)s - %(message)s"))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(main(loop, args.config))
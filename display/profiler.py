@@ -0,0 +1,121 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+
+_LOGGER = logging.getLogger(__name__)
+
+# Where profiles are written
+PROFILE_DIR = '/tmp'
+
+# Seconds a profile runs unless it is stopped earlier
+PROFILE_DURATION = 30
+
+# Stack depth tracemalloc records per allocation
+TRACEMALLOC_FRAMES = 10
+
+# Lines in the text summaries
+REPORT_LINES = 50
+
+
+class Profiler:
+    """cProfile and tracemalloc for a window of the running service.
+
+    `toggle()` starts a profile that stops by itself after `duration`
+    seconds, or straight away when toggled again. The results go to
+    `directory` as `<prefix>.prof` for pstats or snakeviz, `<prefix>.txt`
+    with the functions by cumulative time and `<prefix>-memory.txt` with the
+    allocations that grew over the window. Writing them runs in the default
+    executor so the loop keeps serving the display.
+    """
+
+    def __init__(self, loop, directory=PROFILE_DIR, duration=PROFILE_DURATION):
+        self.loop = loop
+        self.directory = directory
+        self.duration = duration
+        self.profile = None
+        self.started = None
+        self.snapshot = None
+        self.started_tracing = False
+        self.stop_handle = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self, duration=None):
+        if self.running:
+            return
+
+        duration = self.duration if duration is None else duration
+
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.snapshot = tracemalloc.take_snapshot()
+
+        self.started = time.time()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+        self.stop_handle = self.loop.call_later(duration, self.stop)
+        _LOGGER.warning("Profiling for %s s", duration)
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+        self.stop_handle.cancel()
+        self.stop_handle = None
+
+        snapshot = tracemalloc.take_snapshot()
+        if self.started_tracing:
+            tracemalloc.stop()
+
+        prefix = os.path.join(self.directory, time.strftime('displayasync-%Y%m%d-%H%M%S',
+                                                            time.localtime(self.started)))
+        elapsed = time.time() - self.started
+        future = self.loop.run_in_executor(None, self._write, prefix, elapsed, profile, self.snapshot, snapshot)
+        future.add_done_callback(self._written)
+        self.snapshot = None
+
+    @staticmethod
+    def _write(prefix, elapsed, profile, before, after) -> str:
+        profile.dump_stats(f'{prefix}.prof')
+
+        report = io.StringIO()
+        report.write(f'Profiled {elapsed:.1f} s\n')
+        pstats.Stats(profile, stream=report).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LINES)
+        with open(f'{prefix}.txt', 'w') as report_file:
+            report_file.write(report.getvalue())
+
+        # Filter out the snapshot machinery itself
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        with open(f'{prefix}-memory.txt', 'w') as memory_file:
+            memory_file.write(f'Allocations grown over {elapsed:.1f} s\n')
+            for difference in differences[:REPORT_LINES]:
+                memory_file.write(f'{difference}\n')
+
+        return prefix
+
+    @staticmethod
+    def _written(future):
+        try:
+            prefix = future.result()
+        except Exception as e:
+            _LOGGER.error("Could not write profile: %s", repr(e))
+            return
+
+        _LOGGER.warning("Profile written to %s.prof, %s.txt and %s-memory.txt", prefix, prefix, prefix)
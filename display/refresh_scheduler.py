@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# Redraws per second for each class of status field
+FIELD_RATES = {
+    'position': 2,
+    'temperature': 2,
+    'status': 2,
+    'fan': 1,
+    'time': 1,
+}
+
+# Position redraws per second while the toolhead is jogged
+JOG_POSITION_RATE = 10
+
+# Due fields are sent lowest first when the budget is short
+FIELD_PRIORITIES = {
+    'position': 1,
+    'temperature': 2,
+    'status': 3,
+    'fan': 4,
+    'time': 5,
+}
+
+# Serial bytes per second status redraws may use before the baud rate is known
+SERIAL_BUDGET = 2048
+
+# Share of the serial link status redraws may use, and bits sent per byte (8N1)
+SERIAL_SHARE = 0.25
+BITS_PER_BYTE = 10
+
+# Assumed size of a field that has not been sent yet
+DEFAULT_COMMAND_SIZE = 32
+
+
+def serial_budget(baudrate):
+    """Status redraw budget in bytes per second for a link at `baudrate`."""
+    return int(baudrate / BITS_PER_BYTE * SERIAL_SHARE)
+
+
+class RefreshScheduler:
+    """Decides when changed status fields are redrawn.
+
+    Every field class has its own rate and all status redraws share a bytes
+    per second budget for the serial link, kept as a token bucket. Writes
+    made for the user are never held back but use up the budget, so status
+    redraws give way to them. The debt they leave is capped at one second of
+    budget, so a bulk transfer does not hold status redraws back for long.
+    """
+
+    def __init__(self, loop, budget=SERIAL_BUDGET):
+        self.loop = loop
+        self.budget = budget
+        self.rates = dict(FIELD_RATES)
+        self.queue = []
+        self.queued = {}
+        self.urgent = {}
+        self.last_sent = {}
+        self.sizes = {}
+        self.sequence = itertools.count()
+        self.tokens = budget
+        self.refilled = loop.time()
+        self.wakeup = asyncio.Event()
+        self.deferred = 0
+
+    def set_rate(self, kind, rate=None):
+        """Change the rate of a field class, None restores the default."""
+        self.rates[kind] = FIELD_RATES[kind] if rate is None else rate
+
+    def schedule(self, bindings, urgent=False):
+        """Queue changed fields, `urgent` ones skip their rate and the budget."""
+        now = self.loop.time()
+
+        for binding in bindings:
+            if urgent:
+                # Leaves any queued entry stale, see _drop_stale
+                self.queued.pop(binding, None)
+                self.urgent[binding] = None
+                continue
+
+            if binding in self.urgent:
+                continue
+
+            due = max(now, self.last_sent.get(binding, float('-inf')) + 1 / self.rates[binding.kind])
+
+            # Already queued to go out at the same time or sooner
+            queued = self.queued.get(binding)
+            if queued is not None and queued <= due:
+                continue
+
+            self.queued[binding] = due
+            heapq.heappush(self.queue, (due, FIELD_PRIORITIES[binding.kind], next(self.sequence), binding))
+
+        self.wakeup.set()
+
+    def clear(self):
+        self.queue.clear()
+        self.queued.clear()
+        self.urgent.clear()
+
+    def set_budget(self, budget):
+        """Change the bytes per second budget, e.g. after the baud rate changed."""
+        self._refill()
+        self.budget = budget
+        self.tokens = min(self.tokens, budget)
+        self.wakeup.set()
+
+    def consume(self, size):
+        self._refill()
+        self.tokens = max(-self.budget, self.tokens - size)
+
+    def sent(self, binding, size):
+        self.last_sent[binding] = self.loop.time()
+        self.sizes[binding] = size
+
+    async def next_due(self) -> list:
+        """Wait for due fields and return as many as the budget allows."""
+        while True:
+            if self.urgent:
+                batch, self.urgent = list(self.urgent), {}
+                return batch
+
+            self._drop_stale()
+            self._refill()
+            now = self.loop.time()
+
+            if not self.queue:
+                delay = None
+            elif self.queue[0][0] > now:
+                delay = self.queue[0][0] - now
+            elif self.tokens <= 0:
+                self.deferred += 1
+                delay = (DEFAULT_COMMAND_SIZE - self.tokens) / self.budget
+            else:
+                return self._pop_due(now)
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            'queued': len(self.queued) + len(self.urgent),
+            'tokens': self.tokens,
+            'deferred': self.deferred,
+        }
+
+    def _drop_stale(self):
+        # Entries superseded by a later schedule() stay in the heap until they surface
+        while self.queue:
+            due, _, _, binding = self.queue[0]
+            if self.queued.get(binding) == due:
+                return
+            heapq.heappop(self.queue)
+
+    def _pop_due(self, now):
+        due_entries = []
+        while self.queue and self.queue[0][0] <= now:
+            entry = heapq.heappop(self.queue)
+            if self.queued.get(entry[3]) == entry[0]:
+                due_entries.append(entry)
+
+        # By field class when the budget cannot take everything that is due
+        due_entries.sort(key=lambda entry: entry[1])
+
+        batch = []
+        tokens = self.tokens
+        for entry in due_entries:
+            binding = entry[3]
+            if tokens <= 0:
+                heapq.heappush(self.queue, entry)
+                continue
+
+            del self.queued[binding]
+            batch.append(binding)
+            tokens -= self.sizes.get(binding, DEFAULT_COMMAND_SIZE)
+
+        return batch
+
+    def _refill(self):
+        now = self.loop.time()
+        self.tokens = min(self.budget, self.tokens + (now - self.refilled) * self.budget)
+        self.refilled = now
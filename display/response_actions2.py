@@ -2,9 +2,40 @@ from enum import Enum
 
 
 class DISPLAYINPUT(Enum):
+    # Touch and data events
     BUTTON = 0x65
+    PAGE = 0x66
+    TOUCH = 0x67
+    TOUCH_SLEEP = 0x68
+    STRING = 0x70
     TEXT = 0x71
-    ACK = 0x1a
+    SLEEP = 0x86
+    WAKE = 0x87
+    READY = 0x88
+    SD_UPGRADE = 0x89
+    TRANSPARENT_FINISHED = 0xfd
+    TRANSPARENT_READY = 0xfe
+
+    # Instruction return codes ( bkcmd )
+    INVALID_INSTRUCTION = 0x00
+    SUCCESS = 0x01
+    INVALID_COMPONENT = 0x02
+    INVALID_PAGE = 0x03
+    INVALID_PICTURE = 0x04
+    INVALID_FONT = 0x05
+    INVALID_FILE_OPERATION = 0x06
+    INVALID_CRC = 0x09
+    INVALID_BAUD = 0x11
+    INVALID_WAVEFORM = 0x12
+    ACK = 0x1a  # Invalid variable name or attribute
+    INVALID_VARIABLE_OPERATION = 0x1b
+    ASSIGNMENT_FAILED = 0x1c
+    EEPROM_FAILED = 0x1d
+    INVALID_PARAMETER_COUNT = 0x1e
+    IO_FAILED = 0x1f
+    INVALID_ESCAPE = 0x20
+    NAME_TOO_LONG = 0x23
+    BUFFER_OVERFLOW = 0x24
 
 
 # format is Page: Eventtype: EventId : Action
@@ -48,7 +79,7 @@ response_actions = {
         DISPLAYINPUT.TEXT: {
             0: ['PrepareTemp', 'set_extruder_target'],
             1: ['PrepareTemp', 'set_bed_target'],
-            2: ['PrepareTemp', 'set_outerbed_target'],
+            2: ['PrepareTemp', 'set_outer_bed_target'],
         }
     },
     # Prepare ( Move )
@@ -97,9 +128,9 @@ response_actions = {
             1: ['page', 12],  # Language
             2: ['page', 32],  # Temperature
             3: ['page', 84],  # Light
-            4: ['settings_fan'],
-            5: ['settings_motor'],
-            6: ['settings_filament_sensor'],
+            4: ['Settings', 'fan'],
+            5: ['Settings', 'motor'],
+            6: ['Settings', 'filament_sensor'],
             7: ['page', 10],  # Factory Reset
             8: ['page', 35],  # About
             9: ['page', 42],  # Advanced
@@ -137,36 +168,40 @@ response_actions = {
     },
     # Print settings ( Filament )
     27: {
-        0: ['PrintSettingsFilament', 'page_back'], # picc=90 == selected
-        1: ['PrintSettingsFilament', 'temperature_type', 'nozzle'], # picc=90 == selected
-        2: ['PrintSettingsFilament', 'temperature_type', 'bed'], # picc=89
-        3: ['PrintSettingsFilament', 'temperature', 1],
-        4: ['PrintSettingsFilament', 'temperature', 5],
-        5: ['PrintSettingsFilament', 'temperature', 10],
-        6: ['PrintSettingsFilament', 'temperature_set', '+'],
-        7: ['PrintSettingsFilament', 'temperature_set', '-'],
-        8: ['PrintSettingsFilament', 'temperature_off'],
-        10: ['PrintSettingsFilament', 'filament', 'load'],
-        11: ['PrintSettingsFilament', 'filament', 'unload'],
-        12: ['PrintSettingsSpeed', 'show'],
-        13: ['PrintSettingsAdjust', 'show'],
+        DISPLAYINPUT.BUTTON: {
+            0: ['PrintSettingsFilament', 'page_back'], # picc=90 == selected
+            1: ['PrintSettingsFilament', 'temperature_type', 'nozzle'], # picc=90 == selected
+            2: ['PrintSettingsFilament', 'temperature_type', 'bed'], # picc=89
+            3: ['PrintSettingsFilament', 'temperature', 1],
+            4: ['PrintSettingsFilament', 'temperature', 5],
+            5: ['PrintSettingsFilament', 'temperature', 10],
+            6: ['PrintSettingsFilament', 'temperature_set', '+'],
+            7: ['PrintSettingsFilament', 'temperature_set', '-'],
+            8: ['PrintSettingsFilament', 'temperature_off'],
+            10: ['PrintSettingsFilament', 'filament', 'load'],
+            11: ['PrintSettingsFilament', 'filament', 'unload'],
+            12: ['PrintSettingsSpeed', 'show'],
+            13: ['PrintSettingsAdjust', 'show'],
+        }
     },
     # Print settings ( Filament ) ( Pro )
     28: {
-        0: ['PrintSettingsFilament', 'page_back'], # picc=90 == selected
-        1: ['PrintSettingsFilament', 'temperature_type', 'nozzle'], # picc=90 == selected
-        2: ['PrintSettingsFilament', 'temperature_type', 'bed'], # picc=89
-        3: ['PrintSettingsFilament', 'temperature', 1],
-        4: ['PrintSettingsFilament', 'temperature', 5],
-        5: ['PrintSettingsFilament', 'temperature', 10],
-        6: ['PrintSettingsFilament', 'temperature_set', '+'],
-        7: ['PrintSettingsFilament', 'temperature_set', '-'],
-        8: ['PrintSettingsFilament', 'temperature_off'],
-        9: ['PrintSettingsFilament', 'temperature_type', 'outer_bed'],
-        10: ['PrintSettingsFilament', 'filament', 'load'],
-        11: ['PrintSettingsFilament', 'filament', 'unload'],
-        12: ['PrintSettingsSpeed', 'show'],
-        13: ['PrintSettingsAdjust', 'show'],
+        DISPLAYINPUT.BUTTON: {
+            0: ['PrintSettingsFilament', 'page_back'], # picc=90 == selected
+            1: ['PrintSettingsFilament', 'temperature_type', 'nozzle'], # picc=90 == selected
+            2: ['PrintSettingsFilament', 'temperature_type', 'bed'], # picc=89
+            3: ['PrintSettingsFilament', 'temperature', 1],
+            4: ['PrintSettingsFilament', 'temperature', 5],
+            5: ['PrintSettingsFilament', 'temperature', 10],
+            6: ['PrintSettingsFilament', 'temperature_set', '+'],
+            7: ['PrintSettingsFilament', 'temperature_set', '-'],
+            8: ['PrintSettingsFilament', 'temperature_off'],
+            9: ['PrintSettingsFilament', 'temperature_type', 'outer_bed'],
+            10: ['PrintSettingsFilament', 'filament', 'load'],
+            11: ['PrintSettingsFilament', 'filament', 'unload'],
+            12: ['PrintSettingsSpeed', 'show'],
+            13: ['PrintSettingsAdjust', 'show'],
+        }
     },
     37: {
         DISPLAYINPUT.BUTTON: {
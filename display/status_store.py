@@ -0,0 +1,63 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class StatusStore:
+    """Printer object status kept current from notify_status_update.
+
+    Moonraker sends `{object: {field: value}}` with only the fields that
+    changed, so an update touches exactly those fields in place. Changed
+    `(object, field)` pairs collect until the renderer takes them.
+    """
+
+    def __init__(self, status=None):
+        self.status = {}
+        self.changed = set()
+        self.updates = 0
+        self.fields_changed = 0
+        self.fields_unchanged = 0
+
+        if status:
+            self.replace(status)
+
+    def replace(self, status):
+        """Start over from a full status, e.g. a subscription result."""
+        self.status = {name: dict(fields) for name, fields in status.items()}
+        self.changed.update((name, field) for name, fields in self.status.items() for field in fields)
+
+    def update(self, message) -> set:
+        """Apply a status update and return the `(object, field)` pairs it changed."""
+        changed = set()
+        status = self.status
+
+        for name, fields in message.items():
+            current = status.get(name)
+            if current is None:
+                status[name] = dict(fields)
+                changed.update((name, field) for field in fields)
+                continue
+
+            for field, value in fields.items():
+                if current.get(field, _MISSING) != value:
+                    current[field] = value
+                    changed.add((name, field))
+
+        self.updates += 1
+        self.fields_changed += len(changed)
+        self.fields_unchanged += sum(len(fields) for fields in message.values()) - len(changed)
+        self.changed |= changed
+        return changed
+
+    def take_changed(self) -> set:
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def stats(self) -> dict:
+        return {
+            'updates': self.updates,
+            'fields_changed': self.fields_changed,
+            'fields_unchanged': self.fields_unchanged,
+        }
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import threading
+
+from moonraker_api import MoonrakerClient, MoonrakerListener
+from moonraker_api.const import WEBSOCKET_STATE_CONNECTED, WEBSOCKET_STATE_STOPPED
+
+from status_store import StatusStore
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds between connection attempts while Moonraker is down
+RECONNECT_DELAY = 2
+
+# Fields the legacy display shows
+DEFAULT_OBJECTS = {
+    'extruder': ['temperature', 'target'],
+    'heater_bed': ['temperature', 'target'],
+    'toolhead': ['position'],
+}
+
+
+class StatusThread(MoonrakerListener):
+    """Moonraker status subscription for the threaded display.py.
+
+    A background thread runs its own event loop with one websocket to
+    Moonraker, subscribed to `objects`. Status updates are applied to a
+    StatusStore under a lock, so other threads read a local snapshot
+    instead of polling Moonraker over HTTP.
+    """
+
+    def __init__(self, host='127.0.0.1', port=7125, objects=None):
+        self.host = host
+        self.port = port
+        self.objects = DEFAULT_OBJECTS if objects is None else objects
+        self.lock = threading.Lock()
+        self.store = StatusStore()
+        self.ready = threading.Event()
+        self.thread = None
+        self.client = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='moonraker-status', daemon=True)
+        self.thread.start()
+
+    def snapshot(self) -> dict:
+        """Copy of the current status, safe to use from any thread."""
+        with self.lock:
+            return {name: dict(fields) for name, fields in self.store.status.items()}
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._connect_forever(loop))
+
+    async def _connect_forever(self, loop):
+        self.client = MoonrakerClient(self, self.host, self.port, loop=loop)
+
+        while True:
+            try:
+                await self.client.connect()
+                # Returns once the connection is gone
+                await asyncio.gather(self.client._runtask, return_exceptions=True)
+            except Exception as e:
+                _LOGGER.warning("Could not connect to Moonraker: %s", repr(e))
+
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _subscribe(self):
+        response = await self.client.call_method('printer.objects.subscribe', objects=self.objects)
+
+        with self.lock:
+            self.store.replace(response['status'])
+        self.ready.set()
+
+    async def state_changed(self, state: str) -> None:
+        if state == WEBSOCKET_STATE_CONNECTED:
+            # Klippy may have been ready before we connected, there is no event for that
+            if await self.client.get_klipper_status() == 'ready':
+                await self._subscribe()
+        elif state == WEBSOCKET_STATE_STOPPED:
+            self.ready.clear()
+
+    async def on_notification(self, method: str, data) -> None:
+        if method == 'notify_status_update':
+            with self.lock:
+                self.store.update(data[0])
+        elif method == 'notify_klippy_ready':
+            await self._subscribe()
+        elif method in ('notify_klippy_shutdown', 'notify_klippy_disconnected'):
+            self.ready.clear()
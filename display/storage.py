@@ -0,0 +1,38 @@
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+STATE_DIR = os.path.expanduser('~/.cache/opennept4une-display')
+
+
+class JsonStore:
+    """Small JSON document persisted across service restarts."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, 'r') as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _LOGGER.error("Could not read %s: %s", self.path, repr(e))
+            return {}
+
+    def save(self, data):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # Write to a temporary file first so a power cut never leaves half a file
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(data, state_file)
+        os.replace(temp_path, self.path)
+
+    def update(self, **values):
+        data = self.load()
+        data.update(values)
+        self.save(data)
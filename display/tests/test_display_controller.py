@@ -0,0 +1,131 @@
+"""Acknowledgement window of DisplayController against a stub serial transport."""
+import asyncio
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import displayasync  # noqa: E402
+from nextion import TERMINATOR  # noqa: E402
+
+SUCCESS = b'\x01' + TERMINATOR
+OVERFLOW = b'\x24' + TERMINATOR
+STARTUP = b'\x00\x00\x00' + TERMINATOR
+
+
+def page(number):
+    return bytes([0x66, number]) + TERMINATOR
+
+
+class StubTransport(asyncio.Transport):
+    """Keeps every command written to the display."""
+
+    def __init__(self):
+        super().__init__()
+        self.serial = types.SimpleNamespace(rts=False)
+        self.commands = []
+
+    def write(self, data):
+        self.commands += [command.decode() for command in bytes(data).split(TERMINATOR) if command]
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class DisplayControllerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.display = displayasync.DisplayController()
+        self.transport = StubTransport()
+        self.display.connection_made(self.transport)
+        self.display.acknowledged = True
+
+    async def send(self, *commands):
+        await self.display.send_cmds(list(commands))
+        # The flush is scheduled for the next loop iteration
+        await asyncio.sleep(0)
+
+    async def answer(self, data):
+        self.display.data_received(data)
+        await asyncio.sleep(displayasync.ACK_RETRY_DELAY * 2)
+
+    def expire_ack_timer(self):
+        self.display.ack_timer.cancel()
+        self.display._ack_timeout()
+
+    def written_since(self, count):
+        return self.transport.commands[count:]
+
+    async def test_overflow_mid_window_resends_from_the_dropped_command(self):
+        await self.send('page 2', 't1.txt="x"', 'vis q0,1')
+
+        await self.answer(SUCCESS + OVERFLOW + SUCCESS)
+
+        self.assertEqual(self.written_since(3), ['t1.txt="x"', 'vis q0,1'])
+        await self.answer(SUCCESS + SUCCESS)
+        self.assertEqual(self.display.ack_stats(),
+                         {'acks': 5, 'retries': 2, 'errors': 0, 'timeouts': 0, 'in_flight': 0})
+
+    async def test_overflow_is_not_resent_when_the_display_ran_a_later_value(self):
+        await self.send('t0.txt="200"', 't0.txt="201"')
+
+        await self.answer(OVERFLOW + SUCCESS)
+
+        self.assertEqual(self.written_since(2), [])
+        self.assertEqual(self.display.in_flight_count, 0)
+
+    async def test_overflow_skips_a_component_written_again_meanwhile(self):
+        await self.send('t0.txt="a"', 't1.txt="b"')
+        await self.answer(OVERFLOW)
+
+        # Held back until the window has been resent
+        await self.send('t0.txt="c"')
+        self.assertEqual(self.written_since(2), [])
+
+        await self.answer(OVERFLOW)
+
+        self.assertEqual(self.written_since(2), ['t1.txt="b"', 't0.txt="c"'])
+
+    async def test_timeout_resyncs_before_writing_again(self):
+        await self.send('t0.txt="a"')
+        self.expire_ack_timer()
+
+        self.assertEqual(self.transport.commands, ['t0.txt="a"', 'sendme'])
+        self.assertTrue(self.display.resyncing)
+
+        await self.send('t1.txt="b"')
+        # A late code for the command given up on is not taken for the next one
+        await self.answer(SUCCESS)
+        self.assertEqual(self.written_since(2), [])
+
+        await self.answer(page(1))
+        self.assertEqual(self.written_since(2), ['t1.txt="b"'])
+
+        await self.answer(SUCCESS)
+
+        self.assertFalse(self.display.resyncing)
+        self.assertEqual(self.display.ack_stats(),
+                         {'acks': 1, 'retries': 0, 'errors': 0, 'timeouts': 1, 'in_flight': 0})
+
+    async def test_startup_frame_drops_commands_in_flight(self):
+        await self.send('t0.txt="a"')
+
+        await self.answer(STARTUP)
+
+        self.assertFalse(self.display.acknowledged)
+        self.assertEqual(self.display.in_flight_count, 0)
+        self.assertTrue(self.display.command_queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
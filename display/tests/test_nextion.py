@@ -0,0 +1,79 @@
+"""Frame parser cases: frames cut over reads, several per read, 0xFF in values."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nextion import NextionFrameParser, STARTUP_PAYLOAD, TERMINATOR  # noqa: E402
+from response_actions2 import DISPLAYINPUT  # noqa: E402
+
+TOUCH = bytes([0x65, 2, 5, 1]) + TERMINATOR
+PAGE = bytes([0x66, 19]) + TERMINATOR
+SUCCESS = bytes([0x01]) + TERMINATOR
+
+
+class NextionFrameParserTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = NextionFrameParser()
+
+    def test_frame_split_over_reads(self):
+        events = []
+        for byte in TOUCH:
+            events += self.parser.feed(bytes([byte]))
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual((events[0].type, events[0].page, events[0].action, events[0].value),
+                         (DISPLAYINPUT.BUTTON, 2, 5, 1))
+        self.assertEqual(self.parser.buffer, b'')
+
+    def test_frames_merged_in_one_read(self):
+        events = self.parser.feed(TOUCH + PAGE + SUCCESS + TOUCH[:3])
+
+        self.assertEqual([event.type for event in events],
+                         [DISPLAYINPUT.BUTTON, DISPLAYINPUT.PAGE, DISPLAYINPUT.SUCCESS])
+        self.assertEqual(events[1].page, 19)
+        self.assertEqual(self.parser.feed(TOUCH[3:])[0].action, 5)
+
+    def test_0xff_inside_values(self):
+        numeric = bytes([0x71, 27, 3]) + (-1).to_bytes(4, 'little', signed=True) + TERMINATOR
+        touch = bytes([0x67, 0x00, 0xff, 0x01, 0xff, 0x01]) + TERMINATOR
+
+        events = self.parser.feed(numeric + touch)
+
+        self.assertEqual([(event.page, event.action, event.value) for event in events],
+                         [(27, 3, -1), (None, 1, (255, 511))])
+
+    def test_prefixed_numeric_ending_in_0xff_waits_for_more_input(self):
+        frame = bytes([0x71, 27, 3, 0x00, 0x01, 0xff, 0xff]) + TERMINATOR
+
+        # The first 8 bytes are also a complete bare numeric frame
+        self.assertEqual(self.parser.feed(frame[:8]), [])
+        events = self.parser.feed(frame[8:] + SUCCESS)
+
+        self.assertEqual([(event.page, event.action) for event in events], [(27, 3), (None, None)])
+
+    def test_bare_numeric_reply_to_open_query(self):
+        self.parser.queries = 1
+
+        events = self.parser.feed(bytes([0x71, 0x2a, 0, 0, 0]) + TERMINATOR)
+
+        self.assertEqual([(event.page, event.value) for event in events], [(None, 42)])
+        self.assertEqual(self.parser.queries, 0)
+
+    def test_startup_frame_and_invalid_instruction(self):
+        events = self.parser.feed(b'\x00' + STARTUP_PAYLOAD + TERMINATOR + b'\x00' + TERMINATOR)
+
+        self.assertEqual([(event.type, event.payload) for event in events],
+                         [(DISPLAYINPUT.INVALID_INSTRUCTION, STARTUP_PAYLOAD),
+                          (DISPLAYINPUT.INVALID_INSTRUCTION, b'')])
+
+    def test_resync_after_stray_bytes(self):
+        # A touch frame cut short is dropped up to its terminator
+        events = self.parser.feed(b'\xff\xff' + bytes([0x65, 2]) + TERMINATOR + PAGE)
+
+        self.assertEqual([event.type for event in events], [DISPLAYINPUT.PAGE])
+
+
+if __name__ == '__main__':
+    unittest.main()
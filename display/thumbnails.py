@@ -0,0 +1,143 @@
+import hashlib
+import io
+import logging
+import os
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+from storage import STATE_DIR
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(STATE_DIR, 'thumbnails')
+
+# Size of the preview picture on the print preview page
+PREVIEW_SIZE = (160, 160)
+PREVIEW_BACKGROUND = (0, 0, 0)
+
+# Characters sent per cp0.write() call, the whole command with quotes and
+# terminator has to fit the display's acknowledgement window of 512 bytes.
+# A multiple of 4 so no pixel is split across calls.
+CHUNK_SIZE = 480
+
+WORKERS = 2
+
+
+def convert_thumbnail(data, size=PREVIEW_SIZE, background=PREVIEW_BACKGROUND) -> str:
+    """Decode the bytes of a slicer thumbnail, fit it into `size` and encode it as RGB565 hex.
+
+    Runs in a worker process.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = np.asarray(image.convert('RGB'), dtype=np.uint16)
+
+    width, height = size
+    source_height, source_width = pixels.shape[:2]
+    scale = min(width / source_width, height / source_height)
+    fit_width = max(int(source_width * scale), 1)
+    fit_height = max(int(source_height * scale), 1)
+
+    # Nearest neighbour resize by indexing with precomputed row and column maps
+    rows = (np.arange(fit_height) * source_height // fit_height)
+    columns = (np.arange(fit_width) * source_width // fit_width)
+    resized = pixels[rows[:, None], columns]
+
+    canvas = np.empty((height, width, 3), dtype=np.uint16)
+    canvas[:] = background
+    top = (height - fit_height) // 2
+    left = (width - fit_width) // 2
+    canvas[top:top + fit_height, left:left + fit_width] = resized
+
+    rgb565 = ((canvas[..., 0] >> 3) << 11) | ((canvas[..., 1] >> 2) << 5) | (canvas[..., 2] >> 3)
+
+    return rgb565.astype('<u2').tobytes().hex()
+
+
+class Thumbnailer:
+    """Converts gcode thumbnails for the display and caches the result on disk.
+
+    Thumbnails are downloaded from Moonraker, which need not run on this
+    machine. The cache is keyed by host as well, it is shared by all printers.
+    """
+
+    def __init__(self, loop, executor=None, cache_dir=CACHE_DIR):
+        self.loop = loop
+        self.executor = executor
+        self.cache_dir = cache_dir
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=WORKERS)
+
+        return self.executor
+
+    async def get(self, moonraker, file_data, metadata):
+        """Return the encoded preview for a gcode file or None without thumbnail."""
+        thumbnail = self.select(metadata.get('thumbnails') or [])
+        if not thumbnail or not self.available:
+            return None
+
+        cache_path = self._cache_path(f'{moonraker.host}:{moonraker.port}', file_data['filename'],
+                                      metadata.get('modified'))
+        encoded = await self.loop.run_in_executor(None, self._read_cache, cache_path)
+        if encoded is not None:
+            return encoded
+
+        source = posixpath.join(posixpath.dirname(file_data['filename']), thumbnail['relative_path'])
+        try:
+            data = await moonraker.download_file('gcodes', source)
+            encoded = await self.loop.run_in_executor(self.get_executor(), convert_thumbnail, data)
+        except OSError as e:
+            _LOGGER.error("Could not convert thumbnail %s: %s", source, repr(e))
+            return None
+
+        await self.loop.run_in_executor(None, self._write_cache, cache_path, encoded)
+
+        return encoded
+
+    @staticmethod
+    def select(thumbnails):
+        # Smallest thumbnail covering the preview, otherwise the largest one
+        covering = [thumbnail for thumbnail in thumbnails
+                    if thumbnail.get('width', 0) >= PREVIEW_SIZE[0] and thumbnail.get('height', 0) >= PREVIEW_SIZE[1]]
+        if covering:
+            return min(covering, key=lambda thumbnail: thumbnail['width'] * thumbnail['height'])
+
+        if thumbnails:
+            return max(thumbnails, key=lambda thumbnail: thumbnail.get('width', 0) * thumbnail.get('height', 0))
+
+    @staticmethod
+    def chunks(encoded):
+        for start in range(0, len(encoded), CHUNK_SIZE):
+            yield encoded[start:start + CHUNK_SIZE]
+
+    def _cache_path(self, host, filename, modified):
+        key = hashlib.sha1(f'{host}:{filename}:{modified}:{PREVIEW_SIZE}'.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.rgb565')
+
+    @staticmethod
+    def _read_cache(cache_path):
+        try:
+            with open(cache_path, 'r') as cache_file:
+                return cache_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_cache(self, cache_path, encoded):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        temp_path = f'{cache_path}.tmp'
+        with open(temp_path, 'w') as cache_file:
+            cache_file.write(encoded)
+        os.replace(temp_path, cache_path)
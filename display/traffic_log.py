@@ -0,0 +1,112 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import struct
+import time
+from enum import IntEnum
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'N4TL\x01'
+
+# Seconds since the capture started, record kind, payload length
+RECORD_HEADER = struct.Struct('<dBI')
+
+# Bytes buffered before the capture file is written to
+WRITE_BUFFER_SIZE = 65536
+
+# Captures of earlier runs kept as `<path>.1` (newest) to `<path>.<n>`
+CAPTURE_BACKUPS = 3
+
+
+class TRAFFIC(IntEnum):
+    SERIAL_IN = 1     # raw chunk read from the display
+    SERIAL_OUT = 2    # raw chunk written to the display
+    NOTIFICATION = 3  # JSON [method, params] from Moonraker
+    RPC_REQUEST = 4   # JSON [method, params] sent to Moonraker
+    RPC_RESULT = 5    # JSON [method, result] answered by Moonraker
+    STATE = 6         # websocket state name
+
+
+class TrafficLogError(Exception):
+    pass
+
+
+class TrafficRecorder:
+    """Appends display and Moonraker traffic to a compact binary log.
+
+    Every record is a 13 byte header followed by the payload, raw bytes for
+    the serial link and compact JSON for Moonraker, see read_traffic().
+    """
+
+    def __init__(self, path, backups=CAPTURE_BACKUPS):
+        self.path = path
+        rotate(path, backups)
+        self.file = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self.file.write(MAGIC)
+        self.started = time.monotonic()
+        self.records = 0
+
+    def record(self, kind, payload: bytes):
+        if self.file is None:
+            return
+
+        self.file.write(RECORD_HEADER.pack(time.monotonic() - self.started, kind, len(payload)))
+        self.file.write(payload)
+        self.records += 1
+
+    def record_json(self, kind, *values):
+        try:
+            payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        except (TypeError, ValueError) as e:
+            _LOGGER.debug("Could not record %s: %s", kind.name, repr(e))
+            return
+
+        self.record(kind, payload)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            _LOGGER.info("Recorded %d records to %s", self.records, self.path)
+
+
+def rotate(path, backups=CAPTURE_BACKUPS):
+    """Move an existing capture to `<path>.1`, so a restarted service does not overwrite it."""
+    if not os.path.exists(path):
+        return
+
+    try:
+        for index in range(backups, 1, -1):
+            if os.path.exists(f'{path}.{index - 1}'):
+                os.replace(f'{path}.{index - 1}', f'{path}.{index}')
+        if backups:
+            os.replace(path, f'{path}.1')
+    except OSError as e:
+        _LOGGER.warning("Could not rotate %s: %s", path, repr(e))
+
+
+def read_traffic(path) -> list[tuple[float, TRAFFIC, bytes]]:
+    """Records of a capture as `(seconds, kind, payload)`.
+
+    A record cut short by the service being stopped ends the log.
+    """
+    with open(path, 'rb') as capture:
+        data = capture.read()
+
+    if not data.startswith(MAGIC):
+        raise TrafficLogError(f'{path} is not a traffic capture')
+
+    records = []
+    offset = len(MAGIC)
+    while offset + RECORD_HEADER.size <= len(data):
+        timestamp, kind, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            break
+
+        records.append((timestamp, TRAFFIC(kind), data[offset:offset + length]))
+        offset += length
+
+    return records
@@ -1,8 +1,45 @@
-import asyncio
 import glob
+import logging
+import posixpath
+
+from bindings import Binding, axis, duration, integer, model_picture, percent, printer_model, visible
+from file_index import FileIndex, UNWATCHED_DIRECTORIES
+from file_metadata import MetadataFetcher
+
+_LOGGER = logging.getLogger(__name__)
+
+# Popup page used to show errors, t0 holds the message. Its buttons keep the
+# page changes of the stock HMI, it is not remapped to a generic dialog.
+MESSAGE_PAGE = 91
+
+
+def motion(func):
+    """Mark a view method as moving the printer, these run one at a time."""
+    func.motion = True
+    return func
+
+
+POSITION = ('toolhead', 'position')
+
+# Heaters picked on the print settings page
+PRINT_SETTINGS_HEATERS = {
+    'nozzle': 'extruder',
+    'bed': 'heater_bed',
+    'outer_bed': 'heater_bed_outer',
+}
+
+# Status shown around the print area on the main and move pages
+POSITION_BINDINGS = [
+    Binding('x_pos.txt="{}"', [POSITION], axis(0), 'position'),
+    Binding('y_pos.txt="{}"', [POSITION], axis(1), 'position'),
+    Binding('z_pos.txt="{}"', [POSITION], axis(2), 'position'),
+]
 
 
 class View:
+    # Page number to the bindings redrawn while that page is showing
+    bindings = {}
+
     def __init__(self, loop, navigation, moonraker):
         self.loop = loop
         self.navigation = navigation
@@ -14,6 +51,10 @@ class View:
     async def page_back(self):
         await self.navigation.page_back()
 
+    def tasks(self) -> list:
+        """Tasks the view started that outlive the handler starting them."""
+        return []
+
 
 class Prepare(View):
     async def show(self):
@@ -21,23 +62,89 @@ class Prepare(View):
 
 
 class Main(View):
+    bindings = {
+        1: [
+            Binding('nozzletemp.txt="{}°C"', [('extruder', 'temperature')], integer, 'temperature'),
+            Binding('nozzletemp_t.txt="{}°C"', [('extruder', 'target')], integer, 'temperature'),
+            Binding('bedtemp.txt="{}°C"', [('heater_bed', 'temperature')], integer, 'temperature'),
+            Binding('bedtemp_t.txt="{}°C"', [('heater_bed', 'target')], integer, 'temperature'),
+            Binding('out_bedtemp.txt="{}°C"', [('heater_bed_outer', 'temperature')], integer, 'temperature'),
+            Binding('out_bedtemp_t.txt="{}°C"', [('heater_bed_outer', 'target')], integer, 'temperature'),
+            Binding('vis q5,{}', [('heater_bed_outer', 'temperature')], visible, optional=True),
+            Binding('vis out_bedtemp,{}', [('heater_bed_outer', 'temperature')], visible, optional=True),
+            Binding('main.q4.picc={}', [('heater_bed_outer', 'temperature')], model_picture, optional=True),
+            Binding('main.disp_q5.val={}', [('heater_bed_outer', 'temperature')], visible, optional=True),
+        ] + POSITION_BINDINGS,
+    }
 
     async def show(self):
         await self.navigation.page(1)
 
 
 class Print(View):
-    files = []
-    page = 0
+    bindings = {
+        19: [
+            Binding('t0.txt="{}"', [('print_stats', 'filename')]),
+            Binding('nozzletemp.txt="{}"', [('extruder', 'temperature'), ('extruder', 'target')],
+                    lambda current, target: f'{int(current)}/{int(target)}', 'temperature'),
+            Binding('bedtemp.txt="{}°C"', [('heater_bed', 'temperature')], integer, 'temperature'),
+            Binding('out_bedtemp.txt="{}°C"', [('heater_bed_outer', 'temperature')], integer, 'temperature'),
+            Binding('x_pos.txt="X[{}]"', [('gcode_move', 'position')], axis(0), 'position'),
+            Binding('y_pos.txt="Y[{}]"', [('gcode_move', 'position')], axis(1), 'position'),
+            Binding('zvalue.txt="{}"', [('gcode_move', 'position')], axis(2), 'position'),
+            Binding('fanspeed.txt="{}%"', [('fan', 'speed')], percent, 'fan'),
+            Binding('printtime.txt="{}"', [('print_stats', 'print_duration')], duration, 'time'),
+            Binding('t7.txt="{}"', [('print_stats', 'total_duration')], duration, 'time'),
+            Binding('pressure_val.txt="{}mm/s"', [('gcode_move', 'speed')], integer),
+        ],
+    }
     files_per_page = 5
-    file_to_print = None
-    gcode_root = '/home/mks/printer_data/gcodes'
+
+    def __init__(self, loop, navigation, moonraker):
+        super().__init__(loop, navigation, moonraker)
+        # Kept per instance, every printer of a host process has its own
+        self.page = 0
+        self.file_to_print = None
+        self.sort_by = 'modified'
+        self.sort_reverse = True
+        self.light_on = False
+        self.files = []
+        self.directory = ''
+        self.file_index = FileIndex(moonraker)
+        self.metadata = MetadataFetcher(moonraker)
+        self.metadata_task = None
+        # Shared by all printers of the process, with its cache and worker pool
+        self.thumbnailer = navigation.thumbnailer
+        self.thumbnail_task = None
 
     async def show(self):
         await self._refresh_files()
         await self._refresh_page()
         await self._show_file_list()
 
+    async def page_back(self):
+        if not self.directory:
+            await self.navigation.page_back()
+            return
+
+        await self.open_directory(posixpath.dirname(self.directory))
+
+    async def open_directory(self, directory):
+        self.directory = directory
+        self.page = 0
+
+        if directory.split('/')[0] in UNWATCHED_DIRECTORIES:
+            await self.file_index.refresh_directory(directory)
+
+        await self._refresh_page()
+        await self._show_file_list()
+
+    async def set_sort(self, sort_by, reverse=False):
+        self.sort_by = sort_by
+        self.sort_reverse = reverse
+        self.page = 0
+        await self._show_file_list()
+
     async def prev_page(self):
         if self.page >= 1:
             self.page -= 1
@@ -45,14 +152,20 @@ class Print(View):
             await self._show_file_list()
 
     async def next_page(self):
-        if (self.page * self.files_per_page) <= len(self.files):
+        if ((self.page + 1) * self.files_per_page) < self.file_index.count(self.directory):
             self.page += 1
             await self._refresh_page()
             await self._show_file_list()
 
     async def print_file(self, slot):
-        offset = self.page * self.files_per_page + slot
-        file_data = self.files[offset]
+        if slot >= len(self.files):
+            return
+
+        file_data = self.files[slot]
+
+        if file_data['type'] == 'directory':
+            await self.open_directory(file_data['filename'])
+            return
 
         await self.navigation.page(18, False)
 
@@ -60,64 +173,143 @@ class Print(View):
         self.file_to_print = filename
         print_preview_cmds = [f't0.txt="{filename}"']
 
-        if 'thumbnail' in file_data:
-            print(file_data['thumbnail'])
-
         await self.navigation.send_cmds(print_preview_cmds)
 
+        metadata = await self.metadata.fetch(filename, file_data.get('modified'))
+
+        self._cancel_thumbnail()
+        self.thumbnail_task = self.loop.create_task(self._show_thumbnail(file_data, metadata))
+        self.thumbnail_task.add_done_callback(self._thumbnail_shown)
+
     async def print_status(self):
         await self.navigation.page(19, False)
+        await self.navigation.send_cmds(['p0.pic=68', 'vis cp0,0', 'printpause.cp0.close()',
+                                         'flow_speed.txt="100%"', 'printspeed.txt="100%"', 'printvalue.txt="0"'])
+
+    async def settings(self):
+        await self.navigation.views['PrintSettingsFilament'].show()
+
+    async def pause(self):
+        # The same button pauses and resumes
+        if self.moonraker.printer_status['print_stats']['state'] == 'paused':
+            await self.navigation.call_method('printer.print.resume')
+        else:
+            await self.navigation.call_method('printer.print.pause')
+
+    async def stop(self):
+        self.navigation.cancel_motion()
+        await self.navigation.call_method('printer.print.cancel')
+
+    async def led(self):
+        # Only flipped once the printer took the command
+        light_on = not self.light_on
+        await self.navigation.send_gcode(f"Part_Light_{'ON' if light_on else 'OFF'}")
+        self.light_on = light_on
+
+    async def emergency_shutdown(self):
+        self.navigation.cancel_motion()
+        await self.navigation.call_method('printer.emergency_stop')
 
     async def preview_confirm(self):
         if not self.file_to_print:
             return
 
-        filename = self.file_to_print['filename']
-        await self.moonraker.call_method('printer.print.start', filename=filename)
+        self._cancel_thumbnail()
+        await self.navigation.call_method('printer.print.start', filename=self.file_to_print)
 
     async def preview_cancel(self):
+        self._cancel_thumbnail()
         self.file_to_print = None
         await self.show()
 
-    async def _refresh_page(self):
-        await self.navigation.page(2)
+    async def refresh_files(self):
+        await self.file_index.load()
 
-    async def _refresh_files(self):
-        roots = await self.moonraker.call_method('server.files.roots')
-        self.gcode_root = next(filter(lambda root_data: root_data['name'] == 'gcodes', roots))['path']
+    def snapshot(self) -> dict:
+        return {'files': self.file_index.snapshot()}
+
+    def restore(self, snapshot):
+        self.file_index.restore(snapshot.get('files', []))
 
-        print_files = await self.moonraker.call_method('server.files.list', root='gcodes')
-        for file_data in print_files:
-            filename = file_data['path']
-            metadata = await self.moonraker.call_method('server.files.metadata', filename=filename)
+    async def _show_thumbnail(self, file_data, metadata):
+        encoded = None
+        if metadata.get('thumbnails'):
+            encoded = await self.thumbnailer.get(self.moonraker, file_data, metadata)
 
-            thumbnail = None
+        if encoded is None:
+            await self.navigation.send_cmd('vis cp0,0')
+            return
+
+        await self.navigation.send_cmds(['vis cp0,1', 'cp0.close()'])
+
+        # Backpressure in the display writer paces the chunks
+        for chunk in self.thumbnailer.chunks(encoded):
+            await self.navigation.send_cmd(f'cp0.write("{chunk}")')
 
-            if 'thumbnails' in metadata:
-                thumbnail = metadata['thumbnails'][0]
+    def tasks(self) -> list:
+        return [task for task in (self.metadata_task, self.thumbnail_task, *self.metadata.in_flight.values())
+                if task is not None]
 
-            self.files.append({'filename': file_data['path'], 'thumbnail': thumbnail})
+    def _cancel_thumbnail(self):
+        if self.thumbnail_task and not self.thumbnail_task.done():
+            self.thumbnail_task.cancel()
+
+    async def _refresh_page(self):
+        await self.navigation.page(2)
+
+    async def _refresh_files(self):
+        if not self.file_index.loaded:
+            await self.refresh_files()
 
     async def _show_file_list(self):
         file_list_commands = []
         offset = self.page * self.files_per_page
-        cnt = 10
-        for idx in range(offset, offset + self.files_per_page):
-            if idx >= len(self.files):
-                break
-
-            file_data = self.files[idx]
+        self.files = self.file_index.listing(self.directory, offset, self.files_per_page,
+                                             self.sort_by, self.sort_reverse)
+        visible_files = [file_data for file_data in self.files if file_data['type'] == 'file']
 
-            file_list_commands.append(f't{cnt}.txt="{file_data["filename"]}"')
+        for slot in range(self.files_per_page):
+            cnt = 10 + slot
             # File: 193
             # Empty: 194
             # Directory: 195
-            file_list_commands.append(f'p{cnt}.pic=193')
-            cnt += 1
+            if slot >= len(self.files):
+                file_list_commands.append(f't{cnt}.txt=""')
+                file_list_commands.append(f'p{cnt}.pic=194')
+            elif self.files[slot]['type'] == 'directory':
+                file_list_commands.append(f't{cnt}.txt="{self.files[slot]["name"]}"')
+                file_list_commands.append(f'p{cnt}.pic=195')
+            else:
+                file_list_commands.append(f't{cnt}.txt="{self.files[slot]["name"]}"')
+                file_list_commands.append(f'p{cnt}.pic=193')
         await self.navigation.send_cmds(file_list_commands)
 
+        # Fetch metadata for the visible rows only, the page is already drawn
+        if self.metadata_task and not self.metadata_task.done():
+            self.metadata_task.cancel()
+
+        # Metadata stays in the bounded cache of the fetcher, not on the index entries
+        missing = [file_data for file_data in visible_files
+                   if self.metadata.cached(file_data['filename'], file_data.get('modified')) is None]
+        if missing:
+            self.metadata_task = self.loop.create_task(self.metadata.fetch_many(missing))
+            self.metadata_task.add_done_callback(self._metadata_loaded)
+
+    @staticmethod
+    def _metadata_loaded(task):
+        if not task.cancelled() and task.exception():
+            _LOGGER.error("Loading file metadata failed: %s", repr(task.exception()))
+
+    @staticmethod
+    def _thumbnail_shown(task):
+        if not task.cancelled() and task.exception():
+            _LOGGER.error("Showing the thumbnail failed: %s", repr(task.exception()))
+
 
 class PrepareMove(View):
+    bindings = {
+        8: POSITION_BINDINGS,
+    }
     move_distance = 1
 
     async def show(self):
@@ -128,14 +320,14 @@ class PrepareMove(View):
         self.move_distance = width
         await self.navigation.send_cmd(f"p0.pic={button_id}")
 
+    @motion
     async def move_home(self, axis=''):
         await self.navigation.send_gcode(f"G28 {axis}")
 
     async def move_axis(self, operator, axis):
-        distance = self.move_distance
-        await self.navigation.send_gcode('G91')  # Set to relative positioning
-        await self.navigation.send_gcode(f'G1 {axis} {operator}{distance}')  # Move axis
-        await self.navigation.send_gcode('G90')  # Set back to absolute positioning
+        # Not a motion handler, presses made while a move runs are summed into the next one
+        distance = self.move_distance if operator == '+' else -self.move_distance
+        await self.navigation.jog(axis, distance)
 
     async def move_toggle_fan(self):
         status = self.moonraker.printer_status
@@ -149,17 +341,16 @@ class PrepareMove(View):
 
 
 class PrepareTemp(View):
+    bindings = {
+        6: [
+            Binding('nozzle.txt="{}"', [('extruder', 'target')], integer, 'temperature'),
+            Binding('bed.txt="{}"', [('heater_bed', 'target')], integer, 'temperature'),
+            Binding('out_bed.txt="{}"', [('heater_bed_outer', 'target')], integer, 'temperature'),
+        ],
+    }
 
     async def show(self):
         await self.navigation.page(6)
-        status = self.moonraker.printer_status
-        commands = [f'nozzle.txt="{int(status["extruder"]["target"])}"',
-                    f'bed.txt="{int(status["heater_bed"]["target"])}"']
-
-        if 'target' in status['heater_bed_outer']:
-            commands.append(f'out_bed.txt="{int(status["heater_bed_outer"]["target"])}"')
-
-        await self.navigation.send_cmds(commands)
 
     async def extruder_off(self):
         await self.navigation.send_gcode('SET_HEATER_TEMPERATURE heater=extruder target=0')
@@ -201,8 +392,10 @@ class PrepareTemp(View):
             extruder = 230
             bed = 50
 
-        await self.set_extruder_target(extruder)
-        await self.set_bed_target(bed)
+        # Both heaters in one script, so one RPC round trip
+        await self.navigation.send_gcode(f'SET_HEATER_TEMPERATURE heater=extruder target={extruder}',
+                                         f'SET_HEATER_TEMPERATURE heater=heater_bed target={bed}')
+        await self.navigation.send_cmds([f'nozzle.txt="{extruder}"', f'bed.txt="{bed}"'])
 
 
 class PrepareExtruder(View):
@@ -215,6 +408,7 @@ class PrepareExtruder(View):
 
         status = self.moonraker.printer_status
 
+    @motion
     async def move(self, direction):
         status = self.moonraker.printer_status
 
@@ -222,8 +416,7 @@ class PrepareExtruder(View):
             await self.navigation.page(37, False)
             return
 
-        await self.navigation.send_gcode('M83')
-        await self.navigation.send_gcode(f'G1 E{direction}{self.width} F{self.speed}')
+        await self.navigation.send_gcode('M83', f'G1 E{direction}{self.width} F{self.speed}')
 
     async def confirm_temp(self):
         await self.navigation.send_gcode(f'SET_HEATER_TEMPERATURE heater=extruder target={self.extruder_target}')
@@ -242,8 +435,79 @@ class PrepareExtruder(View):
         self.speed = speed
         await self.navigation.send_cmd(f'filamentspeed.txt="{self.speed}"')
 
+
+class Message(View):
+    async def show(self, message=''):
+        await self.navigation.page(MESSAGE_PAGE)
+        text = message.replace('"', "'")
+        await self.navigation.send_cmd(f't0.txt="{text}"')
+
+
 class Settings(View):
-    pass
+    filament_sensor_enabled = True
+
+    async def show(self):
+        await self.navigation.page(11)
+
+    async def fan(self):
+        on = self.moonraker.printer_status['fan']['speed'] == 0
+        await self.navigation.send_gcode(f"M106 S{255 if on else 0}")
+        await self.navigation.send_cmd(f"fanstatue.pic={77 if on else 76}")
+
+    async def motor(self):
+        # Lets the axes be moved by hand
+        await self.navigation.send_gcode('M84')
+
+    async def filament_sensor(self):
+        enabled = not self.filament_sensor_enabled
+        await self.navigation.send_gcode(f'SET_FILAMENT_SENSOR SENSOR=fila ENABLE={int(enabled)}')
+        self.filament_sensor_enabled = enabled
+        await self.navigation.send_cmd(f"filamentdec.pic={77 if enabled else 76}")
+
 
 class Level(View):
-    pass
\ No newline at end of file
+    async def show(self):
+        await self.navigation.page(14)
+
+
+class PrintSettingsFilament(View):
+    heater = 'extruder'
+    step = 10
+    length = 10
+    speed = 300
+
+    async def show(self):
+        # The Pro page has the outer bed heater
+        await self.navigation.page(28 if printer_model(self.moonraker.printer_status) == 'n4pro' else 27)
+
+    async def temperature_type(self, heater):
+        self.heater = PRINT_SETTINGS_HEATERS[heater]
+
+    async def temperature(self, step):
+        self.step = step
+
+    async def temperature_set(self, direction):
+        target = self.moonraker.printer_status[self.heater]['target']
+        target = target + self.step if direction == '+' else target - self.step
+        await self._set_target(max(0, int(target)))
+
+    async def temperature_off(self):
+        await self._set_target(0)
+
+    @motion
+    async def filament(self, direction):
+        distance = self.length if direction == 'load' else -self.length
+        await self.navigation.send_gcode('M83', f'G1 E{distance} F{self.speed}')
+
+    async def _set_target(self, target):
+        await self.navigation.send_gcode(f'SET_HEATER_TEMPERATURE heater={self.heater} target={target}')
+
+
+class PrintSettingsSpeed(View):
+    async def show(self):
+        await self.navigation.page(135)
+
+
+class PrintSettingsAdjust(View):
+    async def show(self):
+        await self.navigation.page(127)
\ No newline at end of file